@@ -76,6 +76,80 @@ def datFile ( dirname, topo, masses, sqrts ):
     ret = ret.replace("//","/")
     return ret
 
+def splitHepmc ( hepmcfile : PathLike, nchunks : int,
+                 outdir : PathLike ) -> List[str]:
+    """ split a hepmc file at the event boundaries into nchunks files, in
+    one pass, dealing out the events in turn. every chunk gets the header
+    and the footer of the file. works for hepmc2 and hepmc3 ascii files.
+
+    :param hepmcfile: the hepmc file, may be gzipped
+    :param outdir: the directory of the chunks
+    :returns: list of the chunk files that got events
+    """
+    import gzip
+    opener = gzip.open if hepmcfile.endswith ( ".gz" ) else open
+    names = [ f"{outdir}/chunk{i}.hepmc" for i in range(nchunks) ]
+    outs = [ open ( n, "wt" ) for n in names ]
+    header, current, nevents = [], None, 0
+    with opener ( hepmcfile, "rt" ) as f:
+        for line in f:
+            if line.startswith ( "E " ):
+                if nevents == 0:
+                    for o in outs:
+                        o.writelines ( header )
+                current = outs[nevents % nchunks]
+                nevents += 1
+                current.write ( line )
+            elif current == None:
+                header.append ( line )
+            elif line.startswith ( "HepMC::" ):
+                for o in outs:
+                    o.write ( line )
+            else:
+                current.write ( line )
+    for o in outs:
+        o.close()
+    for n in names[nevents:]:
+        os.unlink ( n )
+    return names[:nevents]
+
+def decompressor ( hepmcfile : PathLike ):
+    """ a feed for streamToPipe, that decompresses hepmcfile """
+    import gzip, shutil
+    def feed ( out ):
+        with gzip.open ( hepmcfile, "rb" ) as f:
+            shutil.copyfileobj ( f, out, 1 << 20 )
+    return feed
+
+def streamToPipe ( feed ):
+    """ create an anonymous pipe, and let feed write into it in a background
+    thread. the read end is meant as the standard input of a tool, so
+    nothing uncompressed ever hits the disk. unlike named pipes, this
+    works also for tools that refuse non-seekable input files, like
+    DelphesHepMC2, which read their standard input as a stream.
+
+    :param feed: function that writes to the binary file object it is given
+    :returns: the read end, and the feeding thread, both to be handed to
+              closePipe after the tool ran
+    """
+    import threading
+    rfd, wfd = os.pipe()
+    def run():
+        try:
+            with os.fdopen ( wfd, "wb" ) as out:
+                feed ( out )
+        except BrokenPipeError as e: ## the tool stopped reading early
+            pass
+    feeder = threading.Thread ( target = run, daemon = True )
+    feeder.start()
+    return rfd, feeder
+
+def closePipe ( rfd : int, feeder ):
+    """ close our read end of the pipe of streamToPipe, so that a feeder
+    whose tool stopped reading runs into a broken pipe, and wait for it """
+    os.close ( rfd )
+    feeder.join()
+
 def isAssociateProduction ( topo ):
     """ return true if topo is associate squark gluino production
     :param topo: str, e.g. TGQ
@@ -505,59 +579,28 @@ def getEmbakedName(analysisId : str, topo : str, recaster : str ) -> str:
     return retval
 
 def writeEmbaked ( effs : dict, effi_file : PathLike, masses, recaster : str ):
-    """ write our new efficiencies to the embaked file 
+    """ write our new efficiencies to the embaked file. the point is appended
+    to the log of the file, which needs no lock. the log is folded into the
+    embaked file when it gets exported, at the end of mg5Wrapper or by emCreator.
+
     :param effs: the efficiencies, e.g. {"SR1":.5,"SR2":.25}
     :param effi_file: the embaked file, e.g. ATLAS-SUSY-2018-22.T5WW.cm2.embaked
     :param masses: the mass tuple, e.g. (500,200)
     :param recaster: the name of the recaster, MA5, adl, or cm2
     """
-    def lock ( lockfile ):
-        """ lock me """
-        ctr=0
-        while os.path.exists ( lockfile ):
-            ctr+=1
-            if ctr>100:
-                os.unlink ( lockfile )
-            time.sleep ( .2 )
-        f = open ( lockfile, "wt" )
-        f.write ( f"# locked {time.asctime()}\n" )
-        f.close()
-
-    lockfile = effi_file+".lock"
     if recaster not in [ "adl", "cm2", "MA5" ]:
         print ( "[bakeryHelpers] error in {__line__} recaster {recaster} unknown." )
         print ( "[bakeryHelpers] we only know: adl, cm2, MA5" )
-        if os.path.exists ( lockfile ):
-            os.unlink ( lockfile )
         sys.exit()
         
     if not os.path.exists ( "embaked" ):
         os.mkdir ( "embaked" )
     try:
-        lock ( lockfile )
         print ( f"[bakeryHelpers] adding point {masses} to {effi_file}" )
-        previousEffs = {}
-        if os.path.exists ( effi_file ):
-            g = open ( effi_file, "rt" )
-            previousEffs = eval(g.read())
-            g.close()
-        previousEffs[masses]=effs
-        nregions = len(effs)
-        npoints = len(previousEffs)
-        f = open ( effi_file, "wt" )
-        f.write ( f"# EM-Baked {time.asctime()}. {npoints} points, {nregions} signal regions, checkmate2(direct)\n" )
-        f.write( "{" )
-        masses = list ( previousEffs.keys() )
-        masses.sort()
-        for m in masses:
-            v = previousEffs[m]
-            f.write(str(m)+":"+str(v)+",\n")
-        f.write ( "}\n" )
-        f.close()
+        import embakedStore
+        embakedStore.storeFor ( effi_file ).append ( effi_file, masses, effs )
     except Exception as e:
         print ( f"[bakeryHelpers] Exception {e}" )
-    if os.path.exists ( lockfile ):
-        os.unlink ( lockfile )
 
 def getListOfMA5Masses ( topo, sqrts, ana ):
     dirname = "ma5results/"
@@ -662,6 +705,8 @@ def cleanAll():
     files += glob.glob ( "%s/*" % t )
     files += glob.glob ( "%s/T*jet*" % b )
     files += glob.glob ( "%s/ma5_T*jet*" % b )
+    files += glob.glob ( "%s/mg5cache" % b )
+    files += glob.glob ( "%s/delphescache" % b )
     for i in [ "mg5cmd*", "mg5proc*", "tmp*slha", "run*card" ]:
         files += glob.glob ( "%s/%s" % ( t, i ) )
     for i in [ "recast*", "ma5cmd*" ]:
@@ -711,7 +756,7 @@ def nCPUs():
 
 
 def execute( cmd:List[str], logfile:str=None, maxLength=100, cwd:str=None,
-             exit_on_fail=False ):
+             exit_on_fail=False, stdin=None ):
     """ execute cmd in shell
     :param maxLength: maximum length of output to be printed,
                       if == -1 then all output will be printed
@@ -720,6 +765,7 @@ def execute( cmd:List[str], logfile:str=None, maxLength=100, cwd:str=None,
     :param logfile   File where command and its output will be written
     :param cwd       Directory where the command should be executed
     :param exit_on_fail  Whether to invoke sys.exit() on nonzero return value
+    :param stdin     File descriptor that the command reads as standard input
     :return return value of the command
     """
     shell=False
@@ -736,7 +782,8 @@ def execute( cmd:List[str], logfile:str=None, maxLength=100, cwd:str=None,
     while ctr < 5:
         try:
             proc = subprocess.Popen( cmd, cwd=cwd, stdout=subprocess.PIPE,
-                               stderr=subprocess.STDOUT, shell=shell )
+                               stderr=subprocess.STDOUT, shell=shell,
+                               stdin=stdin )
             for c in iter(lambda: proc.stdout.read(1), b""):
                 sys.stdout.buffer.write(c)
             #    # f.buffer.write(c)
@@ -11,6 +11,7 @@ import os, sys, colorama, subprocess, shutil, tempfile, time, io, glob
 import multiprocessing
 import bakeryHelpers
 import locker
+import journal
 from os import PathLike
 
 class CM2Wrapper:
@@ -30,12 +31,14 @@ class CM2Wrapper:
         self.configfile = None
         self.njets = njets
         self.analyses = bakeryHelpers.sModelsName2cm2AnaName ( analyses )
+        self.journalName = analyses ## as the campaign names it
         self.rerun = rerun
         self.keep = keep
         self.keephepmc = keephepmc
         self.basedir = bakeryHelpers.baseDir()
         os.chdir ( self.basedir )
         self.locker = locker.Locker ( sqrts, topo, False )
+        self.journal = journal.Journal ( self.basedir )
         self.cm2tempdir = f"{self.basedir}/cm2tempdir/"
         self.cm2results = f"{self.basedir}/cm2results/"
         bakeryHelpers.mkdir ( self.cm2tempdir )
@@ -187,7 +190,10 @@ class CM2Wrapper:
 
         self.configfile = os.path.join ( self.basedir, "temp", "cm2_" + self.instanceName + "_" + mass_stripped+".ini" )
         f = open ( self.configfile, "wt" )
-        outfile = self.gunzipHepmcFile ( hepmcfile )
+        if not hepmcfile.endswith ( ".gz" ): ## already decompressed
+            outfile = hepmcfile
+        else:
+            outfile = self.gunzipHepmcFile ( hepmcfile )
 
         for line in lines:
             line = line.replace("@@NAME@@", self.instanceName )
@@ -211,6 +217,8 @@ class CM2Wrapper:
             self.checkAtlasSus201822()
         print ( f"[cm2Wrapper] initialise checkmate {self.ver} for {self.analyses}" )
         self.checkInstallation()
+        self.journal.setState ( self.topo, masses, self.sqrts, self.journalName,
+                                "cm2", "recasting" )
         if not os.path.exists ( self.outputfile() ):
             self.createConfigFile ( masses, hepmcfile )
             self.executeCheckMate( masses )
@@ -219,10 +227,15 @@ class CM2Wrapper:
             ananame = bakeryHelpers.cm2AnaNameToSModelSName ( self.analyses )
             effi_file = bakeryHelpers.getEmbakedName ( ananame, self.topo, "cm2" )
             bakeryHelpers.writeEmbaked ( effs, effi_file, masses, "cm2" )
+            self.journal.setState ( self.topo, masses, self.sqrts, self.journalName,
+                                    "cm2", "done", embaked=effi_file )
             self.tempFiles.append ( self.outputfile( final=True ) )
             self.tempFiles.append ( self.cm2tempdir )
             self.tempFiles.append ( self.cm2results )
             self.tempFiles.append ( f"{self.cm2tempdir}/{self.instanceName}" )
+        else:
+            self.journal.setState ( self.topo, masses, self.sqrts, self.journalName,
+                                    "cm2", "failed" )
         self.clean()
         # should we free up that point?
         # self.locker.unlock ( masses )
@@ -47,6 +47,7 @@ import gzip                    # For decompression of hepmc file
 import time                    # Used for waiting after blocking io error
 import glob                    # for finding adl files
 import random                  # Used to randomize waiting time after blocking io error
+import threading               # For serializing ROOT, see rootLock
 from datetime import datetime  # For timestamp of embaked files
 from typing import List, Union, Text # For type hinting
 
@@ -56,17 +57,28 @@ from colorama import Fore
 
 # local imports
 import bakeryHelpers       # For dirnames
+import journal             # For recording the job states
+import delphesCache        # For reusing the delphes outputs
+import hepmcFilter         # For applying the event condition before delphes
 from bakeryHelpers import execute
 
+## ROOT is not thread safe, and the wrappers of a fan-out (see
+## mg5Wrapper.runFanOut) share one process, so all ROOT calls go through it
+rootLock = threading.Lock()
+
 
 class CutLangWrapper:
 
     GZIP_BLOCK = 1 << 24  # Block to decompress gzipped file, ~ 16 MB
+    CLA_SHARED = ["analysis_core", "CLA", "scripts"]  # read-only parts of CutLang
+    CLA_RUN_FILES = ["CLA.sh"]  # read-only files of CutLang/runs that CLA needs
 
     def __init__(self, topo: str, njets: int, rerun: bool, analysis: str,
                  auto_confirm: bool = True, filterString: str = "",
                  keep: bool = False, adl_file : Union[Text,None] = None,
-                 event_condition : Union[Text,None] = None ) -> None:
+                 event_condition : Union[Text,None] = None,
+                 fifo : bool = False, delphes_cache : float = 50.,
+                 prefilter : bool = True, sqrts : float = 13 ) -> None:
         """
         If not already present, clones and builds Delphes, CutLang and ADLLHC Analyses.
         Prepares output directories.
@@ -79,17 +91,29 @@ class CutLangWrapper:
                         (see https://smodels.github.io/docs/ListOfAnalyses )
         :param auto_confirm: Proceed with downloads without prompting
         :param keep: keep temporary files for debugging?
+        :param fifo: stream the decompressed hepmc file into the standard
+                     input of delphes, instead of decompressing it to disk
+        :param delphes_cache: size of the cache of the delphes outputs in GB,
+                     shared by all analyses. 0 disables the cache.
+        :param prefilter: apply the event condition to the hepmc events,
+                     before delphes. if False, it is applied to the delphes
+                     output.
+        :param sqrts: the center-of-mass energy in TeV, for the journal
         """
         # General vars
         self.njets = njets
+        self.sqrts = sqrts
         self.adl_file = adl_file
         self.getEventCondition ( event_condition )
         self.keep = keep ## keep temporary files?
+        self.fifo = fifo
+        self.prefilter = prefilter
         self.topo = topo
         if "," in analysis:
             self._error ( "Multiple analyses supplied. This should be handled by mg5Wrapper!" )
             sys.exit(-1)
         self.analysis = self._standardise_analysis(analysis)
+        self.journal_analysis = analysis  # as the campaign names it
         self.rerun = rerun
         self.auto_confirm = auto_confirm
         if len(filterString) > 0:
@@ -108,6 +132,7 @@ class CutLangWrapper:
         self.initlog = os.path.join(self.tmp_dir.get(), "log_" + time + ".txt")
         self.tempFiles = [] ## way to keep track of tempFiles
         self._delete_dir(self.initlog)
+        self.journal = journal.Journal()
 
         # Cutlang vars
         self.cutlanginstall = "./CutLang/"
@@ -127,6 +152,10 @@ class CutLangWrapper:
         # ====================
         # Check if Delphes dir is present and if not, attempt to clone it from github
         self.delphes_exe = bakeryHelpers.checkDelphesInstall ( self.delphesinstall )
+        self.delphesCache = None
+        if delphes_cache > 0:
+            cachedir = os.path.join(bakeryHelpers.baseDir(), "delphescache")
+            self.delphesCache = delphesCache.DelphesCache(cachedir, delphes_cache)
 
         # =====================
         #      Cutlang Init
@@ -252,80 +281,82 @@ class CutLangWrapper:
         ret = "(" + ret + ")"
         return ret
         
-    def filterDelphesUproot ( self, delph_out : str ):
-        """ lets now go through the delphes file, and keep only events
-            that contains Z bosons AND gammas FIXME doesnt work yet """
-        import uproot
-        f = uproot.open ( delph_out )
-        delphes = f["Delphes"]
-        allpids = delphes["Particle/Particle.PID"].array()
-        print ( "pids of entry 0", list(allpids[0][:10]) )
-        print ( "pids of entry 1", list(allpids[1][:10]) )
-        askfor = ( 22, 25 ) # 22: gamma, 23: Z, 25: higgs
-        bitmask = []
-        for i,pids in enumerate ( allpids ):
-            addMe = True
-            for ask in askfor:
-                if not ask in pids and not -ask in pids:
-                    addMe = False
-            bitmask.append ( addMe )
-        self._msg ( f"@@@@ bitmask is {bitmask}" )
-        """
-        g = uproot.recreate ( "new.root", compression=uproot.ZLIB(4) )
-        g["ProcessID0"]=f["ProcessID0"]
-        g["Delphes"]=delphes
-        g.close()
-        """
+    def eventSelection ( self ) -> str:
+        """ the event condition as a selection on the Particle.PID column,
+            e.g. "Sum(Particle.PID==22)==1 && Sum(Particle.PID==23)==1" """
+        return " && ".join ( [ f"Sum(Particle.PID=={k})=={v}" for k,v in \
+                               sorted ( self.event_condition.items() ) ] )
+
+    def writeEventsBeforeFilter ( self, delph_out : str, nevents : int ):
+        """ store the number of events before the event condition was
+            applied in the delphes root file, see eventsBeforeFilter """
+        import ROOT
+        with rootLock:
+            f = ROOT.TFile ( delph_out, "update" )
+            f.cd()
+            ROOT.TParameter("Long64_t")("eventsBeforeFilter", nevents).Write()
+            f.Close()
+
+    def hasDelphesTree ( self, delph_out : str ) -> bool:
+        """ check that delph_out is a root file with a Delphes tree,
+            i.e. that delphes ran through """
+        if not os.path.isfile ( delph_out ):
+            return False
+        import ROOT
+        with rootLock:
+            f = ROOT.TFile.Open ( delph_out, "read" )
+            if not f or f.IsZombie():
+                return False
+            d = f.Get ( "Delphes" )
+            ret = bool ( d ) and d.InheritsFrom ( "TTree" )
+            f.Close()
+        return ret
 
-    def readRootArray ( self, arr ):
-        """ arr is ROOT.TLeafElement, read all entries """
-        ret = []
-        for i in range(arr.GetNdata()):
-            tmp = arr.GetValue(i)
-            if tmp == int(tmp):
-                tmp = int(tmp)
-            ret.append ( tmp )
+    def eventsBeforeFilter ( self, delph_out : str ) -> Union[int,None]:
+        """ the number of events before the event condition was applied,
+            None if the delphes root file was not filtered """
+        if self.event_condition is None:
+            return None
+        import ROOT
+        with rootLock:
+            f = ROOT.TFile ( delph_out, "read" )
+            p = f.Get ( "eventsBeforeFilter" )
+            ret = None if not p else int ( p.GetVal() )
+            f.Close()
         return ret
 
     def filterDelphes ( self, delph_out : str ):
         """ lets now go through the delphes file, and keep only events
-            that contains Z bosons AND gammas """
+            that fulfill the event condition, e.g. that contain Z bosons
+            AND gammas. the pass mask is computed for all events at once
+            by RDataFrame, the passing events are copied in C++. """
         if self.event_condition is None:
             return
-        bitmask = []
         self._msg ( f"filtering {delph_out}" )
         import ROOT
-        f = ROOT.TFile ( delph_out, "read" )
-        g = ROOT.TFile ( "new.root", "recreate" )
-        d = f.Delphes
-        # d = f.Get("Delphes") does the same as above
-        # branch = d.GetBranch("Particle")
-        leaf = d.GetLeaf("Particle.PID")
-        n = d.GetEntries()
-        cloned = d.CopyTree("0")
-        # 22: gamma, 23: Z, 25: higgs
-        # print ( "event condition is", self.event_condition )
-        for event in range(n):
-            d.GetEntry(event) # start with event #0
-            pids = self.readRootArray(leaf)
-            counts = {}
-            for k in self.event_condition.keys():
-                counts[k] = pids.count(k)
-            passes = True
-            for k,v in self.event_condition.items():
-                if k in counts and v == counts[k]:
-                    continue
-                passes = False
-            # print ( "counts for event", event, "are", counts, "passes", passes )
-            if passes:
-                cloned.Fill()
-        g.Write()
-        g.Close()
-        f.Close()
-        cmd = f"mv new.root {delph_out}"
-        subprocess.getoutput ( cmd )
-
-    def run(self, mass: str, hepmcfile: str, pid: int = None) -> int:
+        tmpfile = f"{delph_out}.filtered"
+        with rootLock:
+            f = ROOT.TFile ( delph_out, "read" )
+            d = f.Get ( "Delphes" )
+            df = ROOT.RDataFrame ( d )
+            passing = df.Define ( "entry", "rdfentry_" ).Filter ( self.eventSelection() )
+            entries = passing.AsNumpy ( [ "entry" ] )["entry"]
+            self._msg ( f"{len(entries)}/{d.GetEntries()} events pass {self.event_condition}" )
+            elist = ROOT.TEntryList ( d )
+            for entry in entries:
+                elist.Enter ( int(entry) )
+            d.SetEntryList ( elist )
+            g = ROOT.TFile ( tmpfile, "recreate" )
+            g.cd() ## CopyTree writes into the current directory
+            cloned = d.CopyTree ( "" )
+            cloned.Write()
+            ROOT.TParameter("Long64_t")("eventsBeforeFilter", d.GetEntries()).Write()
+            g.Close()
+            f.Close()
+        os.rename ( tmpfile, delph_out )
+
+    def run(self, mass: str, hepmcfile: str, pid: int = None,
+            stream = None) -> int:
         """ Gives efficiency values for the given hepmc file.
 
             input.hepmc --> Delphes --> output.root --┬-> CutLang --> eff.embaked
@@ -333,67 +364,77 @@ class CutLangWrapper:
             error values:
                 -1:   Cannot find hepmc file
                 -2:   The analysis has already been done and rerun flag is False
-                -3:   Could not copy CutLang to temporary directory
+                -3:   Could not prepare the CutLang run directory
                 -4    There were no efficiencies found
+                -5    Delphes did not produce a usable output
         :param mass: string that describes the mass vector, e.g. "(1000,100)".
                      If "Masses not specified", then try to extract masses from
                      hepmcfile name. FIXME what now, mass range or tuple of masses?
+        :param stream: a stream to read the decompressed events of hepmcfile
+                       from, a hepmcStream.Stream. it is not closed.
         """
         if mass == "Masses not specified":
             # try to extract mass from hepmc file name
             mass = self.getMassesFromHEPMCFile ( hepmcfile )
-
-        time = datetime.now().strftime('%Y_%m_%d_%H_%M_%S')
-        smass=str(mass)
-        logfile = os.path.join(self.tmp_dir.get(), "_".join(["log", smass, time]) + ".txt")
-        self._delete_dir(logfile)
-        mass_stripped = str(mass).replace("(", "").replace(")", "")
-        mass_stripped = mass_stripped.replace(",", "_").replace(" ", "")
-
-        # embaked file name
-        local_embaked_file = os.path.join(self.out_dir.get(),
-                                 self._get_embaked_name(self.analysis,
-                                                        self.topo,
-                                                        mass_stripped))
-
-        self._info(f"Writing output into directory {self.ana_dir.get()} .")
-        self._info(f"Masses are {mass}")
-
-        if self._check_summary_file(mass):
+        if not self._start(mass):
             return -2
 
-        # Decompress hepmcfile if necessary
-        if not os.path.isfile(hepmcfile):
+        if not os.path.exists(hepmcfile):
             self._error(f"cannot find hepmc file {hepmcfile}.")
+            self._record(mass, "failed")
             return -1
-        if ".gz" in hepmcfile:
-            hepmcfile = self._decompress(hepmcfile, self.tmp_dir.get())
-
 
         # ======================
         #        Delphes
         # ======================
-        # set input/output paths
-        self._msg("Found hepmcfile at", hepmcfile)
-        delphes_card = self._pick_delphes_card()
-        delph_out = os.path.join(self.out_dir.get(), f"delphes_out_{mass_stripped}.root")
+        cachekey, delph_out = self._delphes_output(mass, hepmcfile,
+                                    self._pick_delphes_card(), stream)
+        if delph_out == None:
+            self.removeTempFiles()
+            self._record(mass, "failed")
+            return -5
+        ret = self.runCLA(mass, delph_out)
 
-        # Remove output file if already exists
-        if os.path.exists(delph_out):
-            self._info(f"Removing {delph_out}.")
-            args = ["rm", delph_out]
-            execute(args, logfile=logfile)
+        ## now that we ran cutlang, we are done with the delphes root file
+        self._release_delphes_out(cachekey, delph_out)
+        self.removeTempFiles()
+        return ret
 
+    def _start(self, mass) -> bool:
+        """ start the log of a point, and record that we are recasting it.
+            :returns: False, if the point is done and rerun is False
+        """
+        time = datetime.now().strftime('%Y_%m_%d_%H_%M_%S')
+        smass=str(mass)
+        self.logfile = os.path.join(self.tmp_dir.get(), "_".join(["log", smass, time]) + ".txt")
+        self._delete_dir(self.logfile)
 
-        # run delphes
-        self._debug("Running delphes.")
-        args = [self.delphes_exe, delphes_card, delph_out, hepmcfile]
-        execute(args, logfile=logfile)
-        self._debug("Delphes finished.")
+        self._info(f"Writing output into directory {self.ana_dir.get()} .")
+        self._info(f"Masses are {mass}")
 
-        ## possibly we need to filter the delphes output
-        # self.filterDelphesUproot ( delph_out )
-        self.filterDelphes ( delph_out )
+        if self._check_summary_file(mass):
+            self._record(mass, "done")
+            return False
+        self._record(mass, "recasting")
+        return True
+
+    def _strip_mass(self, mass) -> str:
+        """ "(1000, 100)" -> "1000_100" """
+        mass_stripped = str(mass).replace("(", "").replace(")", "")
+        return mass_stripped.replace(",", "_").replace(" ", "")
+
+    def runCLA(self, mass, delph_out: str) -> int:
+        """ run CutLang on a delphes root file, and write the efficiencies.
+            the root file is left alone. error values as in run.
+        """
+        logfile = self.logfile
+        mass_stripped = self._strip_mass(mass)
+
+        # embaked file name
+        local_embaked_file = os.path.join(self.out_dir.get(),
+                                 self._get_embaked_name(self.analysis,
+                                                        self.topo,
+                                                        mass_stripped))
 
         # ======================
         #        CutLang
@@ -402,16 +443,17 @@ class CutLangWrapper:
         cla_input = os.path.abspath(delph_out)
         cutlangfile = self.pickCutLangFile(self.analysis)
 
-        # copy cutlang to a temporary directory
+        # a run directory of our own, in front of the shared installation
         cla_temp_name = os.path.join(self.tmp_dir.get(), f"CLA_{mass_stripped}")
-        # to prevent errors from copy during reruns delete and remake
+        # to prevent errors during reruns delete and remake
         if os.path.exists(cla_temp_name):
             self._delete_dir(cla_temp_name)
         cla_temp = Directory(cla_temp_name, make=True)
-        if not self._copy_cla(cla_temp.get(), logfile):
+        cla_run_dir = self._prepare_cla_run_dir(cla_temp.get(), logfile)
+        if cla_run_dir is None:
             self.removeTempFiles()
+            self._record(mass, "failed")
             return -3
-        cla_run_dir = os.path.join(cla_temp.get(), self.cutlang_run_dir)
 
         # run CutLang
         cmd = [self.cutlang_script, cla_input, "DELPHES", "-i", cutlangfile]
@@ -419,9 +461,6 @@ class CutLangWrapper:
         execute(cmd, cwd=cla_run_dir, logfile=logfile)
         self._debug("CLA finished.")
 
-        ## now that we ran cutlang, mark the delphes root file as to-be-deleted
-        self.tempFiles.append ( delph_out )
-
         # ====================
         #  Postprocessing
         # ====================
@@ -450,6 +489,10 @@ class CutLangWrapper:
             self._error("Number of events before selection is not constant in all regions:")
             self._error(f"Numbers of events: {set(nevents)}")
             self._error(f"Using the value: {nevents[0]}")
+        # efficiencies are relative to the events before the event condition
+        nbefore = self.eventsBeforeFilter(delph_out)
+        if nbefore != None and len(nevents) > 0:
+            entries, nevents = self._unfilter(entries, nevents, nbefore)
         if len(nevents) > 0:
             # write efficiencies to .embaked file
             self._add_output_summary ( mass )
@@ -472,13 +515,138 @@ class CutLangWrapper:
             ## now that we have an embaked file, mark also the CLA dir as removable
             self.tempFiles.append ( f"{cla_temp_name}" )
             self.removeTempFiles()
+            self._record(mass, "done", embaked=local_embaked_file)
             return 0
         else:
             self.error(f"Did not find any events: {nevents}. Filecount {filecount}. Entries: '{entries}'. CLAdir {cla_run_dir}")
             # self.error(f"directory reads {os.listdir(cla_run_dir)}" )
             self.removeTempFiles()
+            self._record(mass, "failed")
             return -4
 
+    def _delphes_output(self, mass, hepmcfile: str, delphes_card: str,
+                        stream = None) -> tuple:
+        """ the delphes root file of hepmcfile, from the delphes cache,
+            else delphes is run, on stream if given.
+            :returns: the cache key, None if not cached, and the root file.
+                      pass both to _release_delphes_out when done. the root
+                      file is None, if delphes failed.
+        """
+        cachekey = self._delphes_cache_key(hepmcfile, delphes_card)
+        delph_out = None
+        if cachekey != None and not self.rerun:
+            ## on a rerun, the fresh output replaces the cached one
+            delph_out = self.delphesCache.acquire(cachekey)
+        if delph_out == None:
+            delph_out = self._run_delphes(hepmcfile, delphes_card,
+                                          self._strip_mass(mass), self.logfile,
+                                          stream)
+            if delph_out == None:
+                return None, None
+            if cachekey != None:
+                delph_out = self.delphesCache.store(cachekey, delph_out)
+                if delph_out == None:
+                    return None, None
+        return cachekey, delph_out
+
+    def _unfilter(self, entries: str, nevents: List, nbefore: int) -> tuple:
+        """ turn the efficiencies of the nevents[0] events that passed the
+            event condition into efficiencies of all nbefore events.
+            :returns: entries and nevents, relative to nbefore
+        """
+        self._info(f"{nevents[0]} of {nbefore} events passed the event condition")
+        if nbefore == 0:
+            return entries, nevents
+        scale = nevents[0] / nbefore
+        effs = eval("{" + entries + "}")
+        entries = "".join([f"'{k}': {v*scale}, " for k, v in effs.items()])
+        return entries, [nbefore] * len(nevents)
+
+    def _run_delphes(self, hepmcfile: str, delphes_card: str,
+                     mass_stripped: str, logfile: str,
+                     stream = None) -> Union[Text,None]:
+        """ run delphes on hepmcfile, decompressing it if necessary.
+            :param stream: hepmcStream.Stream with the decompressed hepmcfile
+            :returns: the path of the delphes root file, None if it failed
+        """
+        feeder, evfilter, stdin = None, None, None
+        if self.event_condition is not None and self.prefilter:
+            ## delphes only ever sees the events that pass, on its stdin
+            stdin, feeder, evfilter = hepmcFilter.streamFiltered(hepmcfile,
+                                                self.event_condition, stream)
+            hepmcfile = "-"
+        elif stream != None:
+            stdin = stream ## not ours to close
+            hepmcfile = "-"
+        elif ".gz" in hepmcfile and self.fifo:
+            # delphes reads "-" as its standard input
+            stdin, feeder = bakeryHelpers.streamToPipe(
+                    bakeryHelpers.decompressor(hepmcfile))
+            hepmcfile = "-"
+        elif ".gz" in hepmcfile:
+            hepmcfile = self._decompress(hepmcfile, self.tmp_dir.get())
+
+        # set input/output paths
+        self._msg("Found hepmcfile at", hepmcfile)
+        delph_out = os.path.join(self.out_dir.get(), f"delphes_out_{mass_stripped}.root")
+
+        # Remove output file if already exists
+        if os.path.exists(delph_out):
+            self._info(f"Removing {delph_out}.")
+            args = ["rm", delph_out]
+            execute(args, logfile=logfile)
+
+        # run delphes
+        self._debug("Running delphes.")
+        args = [self.delphes_exe, delphes_card, delph_out, hepmcfile]
+        ret = execute(args, logfile=logfile, stdin=stdin)
+        if feeder != None:
+            bakeryHelpers.closePipe(stdin, feeder)
+        self._debug("Delphes finished.")
+        if stream != None and not stream.complete():
+            ## delphes saw only part of the events
+            self._error(f"the hepmc stream broke off, discarding {delph_out}")
+            self._delete_dir(delph_out)
+            return None
+        if ret != 0 or not self.hasDelphesTree(delph_out):
+            self._error(f"delphes failed with exit code {ret}, discarding {delph_out}")
+            self._delete_dir(delph_out)
+            return None
+
+        if evfilter != None:
+            self._msg(f"{evfilter.npass}/{evfilter.ntotal} events pass {self.event_condition}")
+            self.writeEventsBeforeFilter(delph_out, evfilter.ntotal)
+        else:
+            ## possibly we need to filter the delphes output
+            self.filterDelphes ( delph_out )
+        return delph_out
+
+    def _delphes_cache_key(self, hepmcfile: str, delphes_card: str) -> Union[Text,None]:
+        """ the key of the delphes output of hepmcfile in the delphes cache,
+            None if there is no cache, or hepmcfile cannot be checksummed """
+        if self.delphesCache == None:
+            return None
+        hepmcsum = delphesCache.hepmcChecksum(hepmcfile)
+        if hepmcsum == None:
+            return None
+        version = delphesCache.delphesVersion(self.delphes_exe)
+        extra = ""
+        if self.event_condition is not None:
+            extra = str(sorted(self.event_condition.items()))
+        return self.delphesCache.key(hepmcsum, delphes_card, version, extra)
+
+    def _release_delphes_out(self, cachekey: Union[Text,None], delph_out: str):
+        """ release a cached delphes output, or mark it as to-be-deleted """
+        if cachekey != None:
+            self.delphesCache.release(cachekey)
+        else:
+            self.tempFiles.append ( delph_out )
+
+    def _record(self, mass, state, **artifacts):
+        """ record the state of the point in the campaign journal """
+        self.journal.setState(self.topo, mass, self.sqrts, self.journal_analysis, "adl",
+                              state, **artifacts)
+
     def addToEmbakedFile ( self, mass, efficiencies ):
         global_embaked_file = bakeryHelpers.getEmbakedName ( self.analysis,
                 self.topo, "adl" )
@@ -510,8 +678,9 @@ class CutLangWrapper:
         """
         # first try via ROOT, then uproot
         try:
-            tmp_entries, tmp_nevents = self.extract_efficiencies_ROOT(
-                                            cla_out, cla_file )
+            with rootLock:
+                tmp_entries, tmp_nevents = self.extract_efficiencies_ROOT(
+                                                cla_out, cla_file )
         except Exception as e:
             self._info ( f"ROOT-based extractor failed {e}, using uproot-based extractor!" )
             tmp_entries, tmp_nevents = self.extract_efficiencies_uproot(
@@ -759,30 +928,36 @@ class CutLangWrapper:
     # Private methods
     # =========================================================================
 
-    def _copy_cla(self, where, logfile=None):
+    def _prepare_cla_run_dir(self, where, logfile=None):
         """
-        Copy CutLang to temporary directory.
-        :param where    copy destination
+        Prepare a CutLang run directory in where. The read-only parts of the
+        shared installation are linked, so all runs use the same build and
+        the same shared libraries. Only runs/, where CLA writes its outputs,
+        and BP/ are private to the run. Of the shared runs/, only the files
+        of CLA_RUN_FILES are linked, never what other runs left there.
+        :param where    directory of the run
         :param logfile  file where output of all commands is written
+        :returns: the directory to run CLA in, None if it failed
         """
-        partlist = ["analysis_core", "BP", "CLA", "runs", "scripts"]
-        partlist = map(lambda x: os.path.join(self.cutlanginstall, x), partlist)
-        for part in partlist:
-            cmd = ['cp', '-r', part, where]
-            if execute(cmd, logfile=logfile) != 0:
-                return False
-        # To prevent redefinitions we have to replace all the shared libraries
-        # in the tmp directory with links to the original ones
-        core_dir = os.path.join(self.cutlanginstall, 'analysis_core')
-        self._msg( f"Linking {core_dir}" )
-        for filename in os.listdir(core_dir):
-            if filename.endswith(".so"):
-                link_name = os.path.join(where, 'analysis_core', filename)
-                origin_name = os.path.abspath(os.path.join(core_dir, filename))
-                cmd = ['ln', '-sf', origin_name, link_name]
-                if execute(cmd, logfile=logfile) != 0:
-                    return False
-        return True
+        install = os.path.abspath(self.cutlanginstall)
+        shared_run_dir = os.path.join(install, self.cutlang_run_dir)
+        run_dir = os.path.join(where, self.cutlang_run_dir)
+        try:
+            for part in self.CLA_SHARED:
+                os.symlink(os.path.join(install, part), os.path.join(where, part))
+            os.mkdir(run_dir)
+            for filename in self.CLA_RUN_FILES:
+                source = os.path.join(shared_run_dir, filename)
+                if not os.path.exists(source):
+                    raise FileNotFoundError(f"{source} is missing")
+                os.symlink(source, os.path.join(run_dir, filename))
+        except OSError as e:
+            self._error(f"Could not prepare {where}: {e}")
+            return None
+        cmd = ['cp', '-r', os.path.join(install, "BP"), where]
+        if execute(cmd, logfile=logfile) != 0:
+            return None
+        return run_dir
 
     def _read_output_summary ( self ):
         """ read the output summary """
@@ -982,6 +1157,62 @@ class CutLangWrapper:
         result = result.replace("Size(bjets)", "nbjets")
         return result
 
+class CutLangBatch:
+    """ several analyses that share a delphes card, recast in one pass:
+        delphes runs once per point, and CutLang runs once per adl file on
+        the shared root file. the per-analysis outputs are unchanged. """
+
+    def __init__(self, wrappers: List[CutLangWrapper]) -> None:
+        """
+        :param wrappers: the cutlang wrappers of the analyses
+        :raises: ValueError, if the analyses need different delphes cards
+        """
+        cards = set([w._pick_delphes_card() for w in wrappers])
+        if len(cards) != 1:
+            raise ValueError(f"analyses need {len(cards)} delphes cards, expected one")
+        self.delphes_card = cards.pop()
+        self.wrappers = wrappers
+        self.analysis = ",".join([w.analysis for w in wrappers])
+
+    def run(self, mass: str, hepmcfile: str, pid: int = None,
+            stream = None) -> List[int]:
+        """ recast the point for all analyses, see CutLangWrapper.run
+            :returns: the error values of CutLangWrapper.run, per analysis
+        """
+        if mass == "Masses not specified":
+            mass = self.wrappers[0].getMassesFromHEPMCFile ( hepmcfile )
+        ret = [0 if w._start(mass) else -2 for w in self.wrappers]
+        todo = [w for w, r in zip(self.wrappers, ret) if r == 0]
+        if len(todo) == 0:
+            return ret
+        if not os.path.exists(hepmcfile):
+            for w in todo:
+                w._error(f"cannot find hepmc file {hepmcfile}.")
+                w._record(mass, "failed")
+            return [-1 if r == 0 else r for r in ret]
+        ## the first analysis that needs it produces the delphes output
+        first = todo[0]
+        cachekey, delph_out = first._delphes_output(mass, hepmcfile,
+                                                    self.delphes_card, stream)
+        if delph_out == None:
+            first.removeTempFiles()
+            for w in todo:
+                w._record(mass, "failed")
+            return [-5 if r == 0 else r for r in ret]
+        for i, w in enumerate(self.wrappers):
+            if ret[i] == 0:
+                ret[i] = w.runCLA(mass, delph_out)
+        first._release_delphes_out(cachekey, delph_out)
+        first.removeTempFiles()
+        return ret
+
+def batchesOf(wrappers: List[CutLangWrapper]) -> List[CutLangBatch]:
+    """ group the cutlang wrappers of several analyses by delphes card """
+    groups = {}
+    for w in wrappers:
+        groups.setdefault(w._pick_delphes_card(), []).append(w)
+    return [CutLangBatch(g) for g in groups.values()]
+
 class Directory:
     def __init__(self, dirname, make=False):
         self.dirname = dirname
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: delphesCache
+   :synopsis: a content addressed cache of the delphes outputs, keyed by the
+              checksum of the hepmc file, the delphes card and the delphes
+              version, so that all analyses that share a card simulate the
+              events of a point only once. entries that are in use are
+              reference counted, and the least recently used entries that
+              are not in use get evicted when the cache exceeds its size.
+"""
+
+import os, sys, time, sqlite3, hashlib, shutil, colorama
+from typing import Dict, List, Union
+
+def sha1sum ( path : str ) -> str:
+    """ the sha1 checksum of the file at path """
+    h = hashlib.sha1()
+    with open ( path, "rb" ) as f:
+        for chunk in iter ( lambda: f.read ( 1 << 20 ), b"" ):
+            h.update ( chunk )
+    return h.hexdigest()
+
+def hepmcChecksum ( hepmcfile : str ) -> Union[None,str]:
+    """ the checksum of a hepmc file, from its index if it has one.
+    :returns: None, if hepmcfile is not a regular file, e.g. a named pipe
+    """
+    if not os.path.isfile ( hepmcfile ):
+        return None
+    import hepmcIndex
+    index = hepmcIndex.load ( hepmcfile )
+    if index != None:
+        return index.index["sha1"]
+    return sha1sum ( hepmcfile )
+
+def delphesVersion ( delphes_exe : str ) -> str:
+    """ the version of the delphes installation of delphes_exe, from its
+    VERSION file, or else the checksum of the executable """
+    versionfile = os.path.join ( os.path.dirname ( delphes_exe ), "VERSION" )
+    if os.path.exists ( versionfile ):
+        with open ( versionfile, "rt" ) as f:
+            return f.read().strip()
+    return sha1sum ( delphes_exe )
+
+class DelphesCache:
+    def __init__ ( self, dirname : str = "delphescache",
+                   maxsize : float = 50. ):
+        """
+        :param dirname: the directory of the cached root files, and of the
+                        database, dirname/cache.db
+        :param maxsize: the size of the cache, in GB. entries that are in
+                        use are never evicted, so the cache can temporarily
+                        exceed it.
+        """
+        self.dirname = dirname
+        if not os.path.exists ( dirname ):
+            os.makedirs ( dirname, exist_ok = True )
+        self.dbfile = os.path.join ( dirname, "cache.db" )
+        self.maxsize = maxsize
+        self.create()
+
+    def msg ( self, *msg ):
+        print ( "[delphesCache] %s" % " ".join ( msg ) )
+
+    def error ( self, *msg ):
+        print ( "%s[delphesCache] %s%s" % ( colorama.Fore.RED, " ".join ( msg ), \
+                   colorama.Fore.RESET ) )
+
+    def connect ( self ):
+        return sqlite3.connect ( self.dbfile, timeout = 300 )
+
+    def create ( self ):
+        """ create the table, if it does not exist """
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( """CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY, size INTEGER, refcount INTEGER,
+                    created REAL, lastused REAL )""" )
+        finally:
+            conn.close()
+
+    def key ( self, hepmcsum : str, delphes_card : str, version : str,
+              extra : str = "" ) -> str:
+        """ the key of the delphes output of a hepmc file
+        :param hepmcsum: the checksum of the hepmc file, see hepmcChecksum
+        :param delphes_card: path to the delphes card, its content counts
+        :param version: the delphes version, see delphesVersion
+        :param extra: anything else that changes the output, e.g. a filter
+        """
+        h = hashlib.sha1()
+        for token in [ hepmcsum, sha1sum ( delphes_card ), version, extra ]:
+            h.update ( token.encode() + b"\0" )
+        return h.hexdigest()
+
+    def path ( self, key : str ) -> str:
+        """ the root file of key """
+        return os.path.join ( self.dirname, f"{key}.root" )
+
+    def acquire ( self, key : str ) -> Union[None,str]:
+        """ look up key, and hold a reference to it if it is cached.
+        every successful acquire must be followed by a release.
+        :returns: the path of the root file, None if key is not cached
+        """
+        path = self.path ( key )
+        conn = self.connect()
+        try:
+            with conn:
+                cur = conn.execute ( "UPDATE entries SET refcount=refcount+1, lastused=? WHERE key=?",
+                                     ( time.time(), key ) )
+                if cur.rowcount == 0:
+                    return None
+                if not os.path.exists ( path ):
+                    ## deleted behind our back
+                    conn.execute ( "DELETE FROM entries WHERE key=?", ( key, ) )
+                    return None
+        finally:
+            conn.close()
+        self.msg ( f"reusing {path}" )
+        return path
+
+    def store ( self, key : str, rootfile : str ) -> Union[None,str]:
+        """ move rootfile into the cache, and hold a reference to it.
+        if another job stored key meanwhile, the outputs are equivalent,
+        and ours replaces it.
+        :returns: the path of the cached root file, None if rootfile
+                  does not exist
+        """
+        if not os.path.isfile ( rootfile ):
+            self.error ( f"{rootfile} does not exist, not caching it" )
+            return None
+        path = self.path ( key )
+        tmpfile = f"{path}.{os.getpid()}"
+        shutil.move ( rootfile, tmpfile )
+        os.rename ( tmpfile, path )
+        now = time.time()
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( """INSERT INTO entries VALUES (?,?,1,?,?)
+                    ON CONFLICT(key) DO UPDATE SET size=excluded.size,
+                    refcount=refcount+1, lastused=excluded.lastused""",
+                    ( key, os.stat ( path ).st_size, now, now ) )
+        finally:
+            conn.close()
+        self.prune()
+        return path
+
+    def release ( self, key : str ):
+        """ drop a reference to key, evict entries if we are above size """
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( "UPDATE entries SET refcount=MAX(refcount-1,0) WHERE key=?",
+                               ( key, ) )
+        finally:
+            conn.close()
+        self.prune()
+
+    def prune ( self, maxsize : Union[None,float] = None ) -> int:
+        """ evict the least recently used entries that are not in use,
+        until the cache is below maxsize.
+        :param maxsize: in GB, None for the size of the cache
+        :returns: number of evicted entries
+        """
+        if maxsize == None:
+            maxsize = self.maxsize
+        n = 0
+        conn = self.connect()
+        try:
+            with conn:
+                total = conn.execute ( "SELECT COALESCE(SUM(size),0) FROM entries" ).fetchone()[0]
+                rows = conn.execute ( "SELECT key, size FROM entries WHERE refcount=0 ORDER BY lastused" ).fetchall()
+                for key, size in rows:
+                    if total <= maxsize * 1e9:
+                        break
+                    conn.execute ( "DELETE FROM entries WHERE key=?", ( key, ) )
+                    if os.path.exists ( self.path ( key ) ):
+                        os.unlink ( self.path ( key ) )
+                    total -= size
+                    n += 1
+        finally:
+            conn.close()
+        return n
+
+    def reset ( self ) -> int:
+        """ set all reference counts to zero, e.g. after jobs got killed.
+        only call when no jobs are running.
+        :returns: number of entries that had references """
+        conn = self.connect()
+        try:
+            with conn:
+                cur = conn.execute ( "UPDATE entries SET refcount=0 WHERE refcount>0" )
+                return cur.rowcount
+        finally:
+            conn.close()
+
+    def entries ( self ) -> List:
+        """ all entries, most recently used first """
+        conn = self.connect()
+        try:
+            return conn.execute ( "SELECT key, size, refcount, lastused FROM entries ORDER BY lastused DESC" ).fetchall()
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    import argparse
+    argparser = argparse.ArgumentParser(description='the cache of the delphes outputs.')
+    argparser.add_argument ( '-d', '--dirname', help='directory of the cache [delphescache]',
+                             type=str, default="delphescache" )
+    argparser.add_argument ( '-l', '--list', help='list the entries',
+                             action="store_true" )
+    argparser.add_argument ( '-r', '--reset', help='reset all reference counts, only when no jobs are running',
+                             action="store_true" )
+    argparser.add_argument ( '-p', '--prune', help='evict unused entries until the cache is below this size, in GB',
+                             type=float, default=None )
+    args = argparser.parse_args()
+    cache = DelphesCache ( args.dirname )
+    if args.reset:
+        n = cache.reset()
+        print ( f"[delphesCache] reset {n} reference counts" )
+    if args.prune != None:
+        n = cache.prune ( args.prune )
+        print ( f"[delphesCache] evicted {n} entries" )
+    if args.list:
+        for key, size, refcount, lastused in cache.entries():
+            print ( f"{key[:12]} {size/1e6:.1f} MB refs {refcount} used {time.ctime(lastused)}" )
@@ -14,6 +14,8 @@ import bakeryHelpers
 from colorama import Fore
 from typing import List, Tuple
 import gambitHelpers
+import ma5Helpers
+import embakedStore
 from loggerbase import LoggerBase
 
 hasWarned = { "cutlangstats": False, "removeFilesWithLowerThan": 0,
@@ -256,45 +258,7 @@ class emCreator ( LoggerBase ):
             ret = {}
             return ret,0.
         timestamp = os.stat ( summaryfile ).st_mtime
-        f=open(summaryfile,"r")
-        lines=f.readlines()
-        f.close()
-        effs={}
-        for line in lines:
-            p=line.find("#")
-            if p>=0:
-                line=line[:p]
-            line=line.strip()
-            if len(line)==0:
-                continue
-            if "control region" in line:
-                continue
-            line = line.replace("signal region","signal_region")
-            line = line.replace("control region ","control_region_")
-            line = line.replace("signal region ","signal_region_" )
-            line = line.replace("control region","control_region" )
-            line = line.replace("150-1","150 -1")
-            tokens=line.split()
-            if len(tokens) not in [ 7, 8, 10 ]:
-                self.pprint ( "In file %s: cannot parse ``%s'': got %d tokens, expected 8 or 10. skip it" % ( summaryfile, line[:50], len(tokens) ) )
-                self.pprint ( f"   - {str(tokens)}" )
-                continue
-            if len(tokens)==10:
-                dsname,ananame,sr,sig95exp,sig95obs,pp,eff,statunc,systunc,totunc=tokens
-            if len(tokens)==8:
-            # datasetname analysisname signalregion sig95(exp) sig95(obs) efficiency stat
-                dsname,ananame,sr,sig95exp,sig95obs,pp,eff,statunc=tokens
-            if len(tokens)==7:
-            # datasetname analysisname signalregion sig95(exp) sig95(obs) efficiency stat
-                dsname,ananame,sr,sig95exp,pp,eff,statunc=tokens
-
-            eff=float(eff)
-            #if eff == 0.:
-                # print ( "zero efficiency for", ananame,sr )
-            #    continue
-            if not ananame in effs:
-                effs[ananame]={}
-            effs[ananame][sr]=eff
+        effs = ma5Helpers.summaryEffs ( summaryfile )
         self.toDelete.append ( summaryfile )
         self.toDelete.append ( saffile )
         return effs,timestamp
@@ -377,6 +341,52 @@ def embakedFileName ( analysis : str, topo : str, recast : str ):
     fname = f"embaked/{ana_smodels}.{topo}.{recast}.embaked"
     return fname
 
+class CompletionIndex:
+    """ an in-process index of the points that are in the embaked files.
+    an embaked file is loaded once, and reloaded only when it, its log,
+    or the store have changed. """
+    def __init__ ( self ):
+        self.points = {} ## fname -> set of mass tuples
+        self.signatures = {} ## fname -> mtimes at load time
+
+    def signature ( self, fname : str ) -> Tuple:
+        ret = []
+        for f in [ fname, fname+".log", os.path.join ( os.path.dirname(fname), "embaked.db" ) ]:
+            try:
+                ret.append ( os.stat ( f ).st_mtime )
+            except FileNotFoundError as e:
+                ret.append ( None )
+        return tuple(ret)
+
+    def load ( self, fname : str ):
+        """ (re)load fname, if it has changed """
+        sig = self.signature ( fname )
+        if fname in self.signatures and self.signatures[fname] == sig:
+            return
+        ## the points may live only in the store, so always ask it
+        D = embakedStore.storeFor ( fname ).points ( fname )
+        done = set ( [ embakedStore.canonical ( m ) for m,v in D.items() \
+                       if v not in [ {}, None ] ] )
+        self.points[fname] = done
+        self.signatures[fname] = sig
+
+    def isDone ( self, masses, analysis, topo, recaster : list ) -> bool:
+        """ are the masses in the embaked file? """
+        fname = embakedFileName ( analysis, topo, recaster[0] )
+        self.load ( fname )
+        return embakedStore.canonical ( masses ) in self.points[fname]
+
+    def filterDone ( self, masses : List, analysis, topo, recaster : list ) -> List:
+        """ remove the points that are already in the embaked file
+        :param masses: list of mass tuples
+        :returns: the mass tuples that are not yet done, in the same order
+        """
+        fname = embakedFileName ( analysis, topo, recaster[0] )
+        self.load ( fname )
+        return [ m for m in masses if not embakedStore.canonical ( m ) in self.points[fname] ]
+
+completionIndex = CompletionIndex()
+
 def massesInEmbakedFile ( masses, analysis, topo, recaster : list ):
     """ are the masses in the embaked file?
     :param masses: e.g. (800,200)
@@ -384,17 +394,7 @@ def massesInEmbakedFile ( masses, analysis, topo, recaster : list ):
     :param topo: e.g. T2
     :param recaster: which recaster to consider
     """
-    fname = embakedFileName ( analysis, topo, recaster[0] )
-    if not os.path.exists ( fname ):
-        # if we dont even have an embaked file, for sure the masses are not in.
-        return False
-    with open ( fname, "rt" ) as f:
-        lines = f.read()
-        f.close()
-        D = eval(lines)
-        if masses in D.keys() and D[masses] not in [ {}, None ]:
-            return True
-    return False
+    return completionIndex.isDone ( masses, analysis, topo, recaster )
 
 def createEmbakedFile( effs, topo, recast : str, tstamps, creator, copy,
                        create_stats ) -> int:
@@ -408,20 +408,18 @@ def createEmbakedFile( effs, topo, recast : str, tstamps, creator, copy,
         if len(values.keys()) == 0:
             continue
         fname = embakedFileName ( ana, topo, recast )
+        store = embakedStore.storeFor ( fname )
         D={}
-        ## read in the old stuff
-        if os.path.exists ( fname ):
-            f = open ( fname, "rt" )
-            try:
-                D = eval ( f.read() )
-                f.close()
-                for k,v in D.items():
-                    if not k in values:
-                        values[k]=v
-            except SyntaxError as e:
-                print ( f"[emCreator] removing {fname}" )
-                cmd = f"rm {fname}"
-                subprocess.getoutput ( cmd )
+        ## read in the old stuff. the points may live only in the store
+        try:
+            D = store.points ( fname )
+            for k,v in D.items():
+                if not k in values:
+                    values[k]=v
+        except ( SyntaxError, ValueError ) as e:
+            print ( f"[emCreator] removing {fname}" )
+            cmd = f"rm {fname}"
+            subprocess.getoutput ( cmd )
         ts = {}
         if ana in tstamps:
             ts = tstamps[ana]
@@ -449,10 +447,6 @@ def createEmbakedFile( effs, topo, recast : str, tstamps, creator, copy,
         
         if hasChanged:
             print ( f"{Fore.GREEN}[emCreator] baking {fname}: {len(values)} points.{Fore.RESET}" )
-            f=open(fname,"w")
-            f.write ( f"# EM-Baked {time.asctime()}. {len(values.keys())} points, {nSRs} signal regions, {recast}(emCreator)\n" )
-            # f.write ( "%s\n" % values )
-            f.write ( "{" )
             for k,v in values.items():
                 t=None
                 if k in ts:
@@ -467,9 +461,8 @@ def createEmbakedFile( effs, topo, recast : str, tstamps, creator, copy,
                     # v["__t__"]="?"
                 if not recast in [ "adl", "colliderbit" ] and not "__nevents__" in v:
                     v["__nevents__"]=creator.getNEvents ( k )
-                f.write ( "%s: %s, \n" % ( k,v ) )
-            f.write ( "}\n" )
-            f.close()
+            store.putMany ( fname, values )
+            store.export ( fname, f"{recast}(emCreator)", nregions = nSRs )
         sqrts = 13
         experiment = "CMS"
         if "atlas" in ana.lower():
@@ -804,14 +797,7 @@ def getColliderbitListOfAnalyses() -> List:
 def embakedFile ( ana : str, topo : str, recaster: list ):
     """ return the content of the embaked file """
     fname = embakedFileName ( ana, topo, recaster[0] )
-    if not os.path.exists ( fname ):
-        return {}
-    with open ( fname, "rt" ) as f:
-        lines = f.read()
-        f.close()
-        D=eval(lines)
-        return D
-    return {}
+    return embakedStore.storeFor ( fname ).points ( fname )
 
 def run ( args ):
     analyses = args.analyses
@@ -825,20 +811,19 @@ def run ( args ):
     if args.colliderbit:
         recaster = [ "colliderbit" ]
     ntot, ntotembaked = 0, 0
-    files = glob.glob ( "embaked/*embaked" )
-    files.sort()
+    store = embakedStore.EmbakedStore ( "embaked" )
+    ## also the points that we do not revisit below, e.g. of cm2
+    for fname in store.exportPending():
+        print ( f"[emCreator] exported the new points of {fname}" )
+    files = sorted ( set ( glob.glob ( "embaked/*embaked" ) + store.files() ) )
     for fname in files:
-        f=open(fname,"rt")
-        txt=f.read()
         try:
-            D=eval(txt)
-            f.close()
-            nplus = len(D.keys())
+            nplus = store.count ( fname )
             if False: # args.verbose:
                 print ( f"[emCreator] in {fname}: {nplus} points" )
             ntotembaked+=nplus
         except Exception as e:
-            print ( f"[emCreator] error with {fname}: {e} {txt:.20s}" )
+            print ( f"[emCreator] error with {fname}: {e}" )
         # ntot+=nplus
 
     analyses = getMG5ListOfAnalyses()
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: embakedStore
+   :synopsis: an indexed store for the efficiencies of the embaked files.
+              the points live in an sqlite database next to the .embaked files,
+              the .embaked text files are exported from it for the
+              smodels-database. new points are appended to a per-file log,
+              that is compacted into the database on export.
+"""
+
+import os, sys, time, socket, sqlite3, ast, glob, colorama
+from typing import Dict, List, Union, Tuple
+
+def canonical ( masses ):
+    """ masses with integral floats turned into ints, so that (500., 200)
+    and (500, 200) are the same point, also in nested tuples """
+    if isinstance ( masses, ( tuple, list ) ):
+        return tuple ( [ canonical ( m ) for m in masses ] )
+    if isinstance ( masses, float ) and masses.is_integer():
+        return int ( masses )
+    return masses
+
+def massesKey ( masses ) -> str:
+    """ the canonical key of a mass tuple, as it appears in the embaked
+    files, e.g. "(500, 200)" """
+    return str ( canonical ( masses ) )
+
+class EmbakedStore:
+    def __init__ ( self, dirname : str = "embaked" ):
+        """
+        :param dirname: the directory of the .embaked files. the database
+                        is dirname/embaked.db
+        """
+        if dirname in [ None, "" ]:
+            dirname = "."
+        self.dirname = dirname
+        if not os.path.exists ( dirname ):
+            os.mkdir ( dirname )
+        self.dbfile = os.path.join ( dirname, "embaked.db" )
+        self.create()
+
+    def error ( self, *msg ):
+        print ( "%s[embakedStore] %s%s" % ( colorama.Fore.RED, " ".join ( msg ), \
+                   colorama.Fore.RESET ) )
+
+    def connect ( self ):
+        return sqlite3.connect ( self.dbfile, timeout = 300 )
+
+    def create ( self ):
+        """ create the tables, if they do not exist. points are keyed by the
+        base name of their .embaked file, and indexed by the first three
+        masses for range queries. """
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( """CREATE TABLE IF NOT EXISTS points (
+                    file TEXT, masses TEXT, m0 REAL, m1 REAL, m2 REAL,
+                    effs TEXT, PRIMARY KEY ( file, masses ) )""" )
+                conn.execute ( "CREATE INDEX IF NOT EXISTS massindex ON points ( file, m0, m1, m2 )" )
+                conn.execute ( "CREATE TABLE IF NOT EXISTS files ( file TEXT PRIMARY KEY, mtime REAL )" )
+        finally:
+            conn.close()
+
+    def key ( self, fname : str ) -> str:
+        return os.path.basename ( fname )
+
+    def path ( self, fname : str ) -> str:
+        return os.path.join ( self.dirname, self.key ( fname ) )
+
+    def row ( self, fname : str, masses, effs : Dict ) -> Tuple:
+        """ the database row of a point """
+        ms = [ None, None, None ]
+        for i,m in enumerate ( list(masses)[:3] ):
+            if type(m) in [ int, float ]:
+                ms[i] = float(m)
+        return ( self.key(fname), massesKey(masses), *ms, repr(effs) )
+
+    def sync ( self, fname : str ):
+        """ import the text file fname, if it has changed since we last
+        imported or exported it, e.g. because it was copied in by hand.
+        :raises: SyntaxError or ValueError, if the file cannot be parsed
+        """
+        path = self.path ( fname )
+        if not os.path.exists ( path ):
+            return
+        mtime = os.stat ( path ).st_mtime
+        conn = self.connect()
+        try:
+            row = conn.execute ( "SELECT mtime FROM files WHERE file=?",
+                                 ( self.key(fname), ) ).fetchone()
+        finally:
+            conn.close()
+        if row != None and row[0] >= mtime:
+            return
+        self.importFile ( path, mtime )
+
+    def importFile ( self, path : str, mtime : Union[None,float] = None ):
+        """ import a .embaked text file, replacing what we have for it """
+        if mtime == None:
+            mtime = os.stat ( path ).st_mtime
+        with open ( path, "rt" ) as f:
+            D = ast.literal_eval ( f.read() )
+            f.close()
+        rows = [ self.row ( path, m, v ) for m,v in D.items() ]
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( "DELETE FROM points WHERE file=?", ( self.key(path), ) )
+                conn.executemany ( "INSERT INTO points VALUES (?,?,?,?,?,?)", rows )
+                conn.execute ( "INSERT OR REPLACE INTO files VALUES (?,?)",
+                               ( self.key(path), mtime ) )
+        finally:
+            conn.close()
+
+    def logFile ( self, fname : str ) -> str:
+        """ the append-only log of new points of fname """
+        return self.path ( fname ) + ".log"
+
+    def append ( self, fname : str, masses, effs : Dict ):
+        """ add a point to the log of fname, with a single atomic append.
+        needs no lock, the point gets into the database when compacting. """
+        line = repr ( ( tuple(masses), effs ) ) + "\n"
+        fd = os.open ( self.logFile ( fname ),
+                       os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644 )
+        try:
+            os.write ( fd, line.encode() )
+        finally:
+            os.close ( fd )
+
+    def readLog ( self, fname : str ) -> Dict:
+        """ the points in the log of fname, including logs that are
+        being compacted. later records win. incomplete lines are skipped.
+        :returns: dictionary of mass tuple -> efficiencies
+        """
+        logfile = self.logFile ( fname )
+        ret = {}
+        for f in sorted ( glob.glob ( f"{logfile}.*" ) ) + [ logfile ]:
+            try:
+                with open ( f, "rt" ) as h:
+                    lines = h.readlines()
+                    h.close()
+            except FileNotFoundError as e:
+                continue
+            for line in lines:
+                try:
+                    masses, effs = ast.literal_eval ( line )
+                    ret[masses] = effs
+                except ( SyntaxError, ValueError ) as e:
+                    pass
+        return ret
+
+    def compact ( self, fname : str ) -> int:
+        """ fold the log of fname into the database. the log is first
+        renamed, so appends that come in meanwhile go to a fresh log.
+        :returns: number of points that were folded in
+        """
+        logfile = self.logFile ( fname )
+        if os.path.exists ( logfile ):
+            claimed = f"{logfile}.{socket.gethostname()}.{os.getpid()}"
+            try:
+                os.rename ( logfile, claimed )
+                time.sleep ( 1. ) ## let appends that are in flight finish
+            except FileNotFoundError as e:
+                pass
+        ## also pick up what an interrupted compaction left behind
+        claimedFiles = glob.glob ( f"{logfile}.*" )
+        if len(claimedFiles) == 0:
+            return 0
+        points = self.readLog ( fname )
+        self.putMany ( fname, points )
+        for f in claimedFiles:
+            try:
+                os.unlink ( f )
+            except FileNotFoundError as e: ## a concurrent compaction was faster
+                pass
+        return len(points)
+
+    def get ( self, fname : str, masses ) -> Union[None,Dict]:
+        """ the efficiencies of one point, None if we dont have it """
+        logged = self.readLog ( fname )
+        if tuple(masses) in logged:
+            return logged[tuple(masses)]
+        self.sync ( fname )
+        conn = self.connect()
+        try:
+            ## rows written before the keys were canonical may have floats
+            row = conn.execute ( "SELECT effs FROM points WHERE file=? AND masses IN (?,?)",
+                    ( self.key(fname), massesKey(masses), str(tuple(masses)) ) ).fetchone()
+        finally:
+            conn.close()
+        if row == None:
+            return None
+        return ast.literal_eval ( row[0] )
+
+    def contains ( self, fname : str, masses ) -> bool:
+        """ do we have non-empty efficiencies for masses? """
+        effs = self.get ( fname, masses )
+        return effs not in [ None, {} ]
+
+    def put ( self, fname : str, masses, effs : Dict ):
+        """ add or replace the efficiencies of one point """
+        self.putMany ( fname, { tuple(masses): effs } )
+
+    def putMany ( self, fname : str, points : Dict ):
+        """ add or replace the efficiencies of many points, in one transaction
+        :param points: dictionary of mass tuple -> efficiencies
+        """
+        self.sync ( fname )
+        rows = [ self.row ( fname, m, v ) for m,v in points.items() ]
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany ( "INSERT OR REPLACE INTO points VALUES (?,?,?,?,?,?)", rows )
+        finally:
+            conn.close()
+
+    def points ( self, fname : str, ranges : List = [] ) -> Dict:
+        """ the points of fname, optionally within mass ranges.
+        the database and the log are merged.
+        :param ranges: list of (min,max) for the first masses, e.g.
+                       [ (500,1000), (0,200) ]. None means unbounded.
+        :returns: dictionary of mass tuple -> efficiencies
+        """
+        self.sync ( fname )
+        query = "SELECT masses, effs FROM points WHERE file=?"
+        params = [ self.key(fname) ]
+        for i,( lo, hi ) in enumerate ( ranges[:3] ):
+            if lo != None:
+                query += f" AND m{i}>=?"
+                params.append ( lo )
+            if hi != None:
+                query += f" AND m{i}<=?"
+                params.append ( hi )
+        conn = self.connect()
+        try:
+            rows = conn.execute ( query, params ).fetchall()
+        finally:
+            conn.close()
+        ret = { ast.literal_eval(m): ast.literal_eval(v) for m,v in rows }
+        for m,v in self.readLog ( fname ).items():
+            inRange = True
+            for i,( lo, hi ) in enumerate ( ranges[:3] ):
+                if type(m[i]) not in [ int, float ]:
+                    continue
+                if ( lo != None and m[i] < lo ) or ( hi != None and m[i] > hi ):
+                    inRange = False
+            if inRange:
+                ret[m] = v
+        return ret
+
+    def files ( self ) -> List[str]:
+        """ the names of all files that have points in the database """
+        conn = self.connect()
+        try:
+            rows = conn.execute ( "SELECT DISTINCT file FROM points" ).fetchall()
+        finally:
+            conn.close()
+        return [ self.path ( r[0] ) for r in rows ]
+
+    def count ( self, fname : str ) -> int:
+        """ the number of points of fname """
+        self.sync ( fname )
+        conn = self.connect()
+        try:
+            rows = conn.execute ( "SELECT masses FROM points WHERE file=?",
+                                  ( self.key(fname), ) ).fetchall()
+        finally:
+            conn.close()
+        keys = set ( [ canonical ( ast.literal_eval(r[0]) ) for r in rows ] )
+        logged = set ( [ canonical ( m ) for m in self.readLog ( fname ).keys() ] )
+        return len ( keys | logged )
+
+    def export ( self, fname : str, comment : str = "embakedStore",
+                 nregions : Union[None,int] = None ):
+        """ write the points of fname as a .embaked text file, in the format
+        of the smodels-database.
+        :param comment: the producer, as given in the header line
+        :param nregions: the number of signal regions for the header line,
+                         if None, count the regions that do not start with "__"
+        """
+        self.compact ( fname )
+        D = self.points ( fname )
+        if nregions == None:
+            SRs = set()
+            for v in D.values():
+                SRs |= set ( [ sr for sr in v.keys() if not sr.startswith("__") ] )
+            nregions = len(SRs)
+        path = self.path ( fname )
+        tmpfile = f"{path}.{os.getpid()}"
+        with open ( tmpfile, "wt" ) as f:
+            f.write ( f"# EM-Baked {time.asctime()}. {len(D)} points, {nregions} signal regions, {comment}\n" )
+            f.write ( "{" )
+            for m in sorted ( D.keys() ):
+                f.write ( "%s: %s, \n" % ( m, D[m] ) )
+            f.write ( "}\n" )
+            f.close()
+        os.rename ( tmpfile, path )
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( "INSERT OR REPLACE INTO files VALUES (?,?)",
+                               ( self.key(fname), os.stat ( path ).st_mtime ) )
+        finally:
+            conn.close()
+
+    def pending ( self ) -> List[str]:
+        """ the .embaked files with points in their logs, that have not been
+        exported yet, including logs of interrupted compactions """
+        ret = set()
+        for logfile in glob.glob ( f"{self.dirname}/*.embaked.log*" ):
+            try:
+                if os.stat ( logfile ).st_size == 0:
+                    continue
+            except FileNotFoundError as e: ## compacted meanwhile
+                continue
+            p = logfile.rfind ( ".log" )
+            ret.add ( logfile[:p] )
+        return sorted ( ret )
+
+    def exportPending ( self ) -> List[str]:
+        """ export all files with pending points, see pending. the logs
+        alone are invisible to everyone who reads the .embaked files.
+        :returns: the exported files
+        """
+        files = self.pending()
+        for fname in files:
+            recaster = self.key ( fname ).split(".")[-2]
+            self.export ( fname, f"{recaster}(embakedStore)" )
+        return files
+
+def storeFor ( fname : str ) -> EmbakedStore:
+    """ the store that holds the points of the .embaked file fname """
+    return EmbakedStore ( os.path.dirname ( fname ) )
+
+if __name__ == "__main__":
+    import argparse
+    argparser = argparse.ArgumentParser(description='the store of the embaked files.')
+    argparser.add_argument ( '-d', '--dirname', help='directory of the embaked files [embaked]',
+                             type=str, default="embaked" )
+    argparser.add_argument ( '-e', '--export', help='export the given .embaked file(s) from the store, "all" for all [None]',
+                             type=str, default=None )
+    argparser.add_argument ( '-l', '--list', help='list the number of points per file',
+                             action="store_true" )
+    argparser.add_argument ( '-c', '--compact', help='fold all logs into the database',
+                             action="store_true" )
+    args = argparser.parse_args()
+    store = EmbakedStore ( args.dirname )
+    files = glob.glob ( f"{args.dirname}/*.embaked" )
+    files += [ f[:-4] for f in glob.glob ( f"{args.dirname}/*.embaked.log" ) ]
+    files += store.files()
+    files = sorted ( set ( files ) )
+    if args.compact:
+        for f in files:
+            n = store.compact ( f )
+            if n > 0:
+                print ( f"[embakedStore] compacted {n} points into {store.key(f)}" )
+    if args.list:
+        for f in files:
+            print ( f"{store.key(f)}: {store.count(f)} points" )
+    if args.export != None:
+        if args.export != "all":
+            files = args.export.split(",")
+        for f in files:
+            store.export ( f )
+            print ( f"[embakedStore] exported {store.path(f)}" )
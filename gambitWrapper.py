@@ -14,6 +14,7 @@ import gambitHelpers
 import bakeryHelpers
 from loggerbase import LoggerBase
 import locker
+import journal
 from typing import Union
 
 class GambitWrapper ( LoggerBase ):
@@ -43,6 +44,7 @@ class GambitWrapper ( LoggerBase ):
         self.templateDir = os.path.join(self.basedir, "templates/")
         self.tempFiles = [ "CBS_logs/" ]
         self.locker = locker.Locker ( sqrts, topo, False )
+        self.journal = journal.Journal ( self.basedir )
         if not self.ana in self.idToGambit:
             self.error ( f"we dont know of {self.ana}, do check gambitdict.cache" )
             # sys.exit()
@@ -87,16 +89,29 @@ class GambitWrapper ( LoggerBase ):
     def run( self, masses, hepmcfile, pid=None ):
         """ Run colliderbit over an hepmcfile, specifying the process
         :param pid: unix process id, for debugging
-        :param hepmcfile: the hepcmfile name
+        :param hepmcfile: the hepcmfile name. a gzipped file is taken from
+                          mg5results/, an unzipped one is read as is
         :returns: -1 if problem occured, 0 if all went smoothly,
                    1 if nothing needed to be done.
         """
         hepmczipfile = self.locker.hepmcFileName ( masses )
-        hepmcfile = self.gunzipHepmcFile ( hepmczipfile )
+        if hepmcfile != None and not hepmcfile.endswith ( ".gz" ):
+            pass ## already decompressed
+        else:
+            hepmcfile = self.gunzipHepmcFile ( hepmczipfile )
         self.createYamlFile( masses, hepmcfile )
+        self.journal.setState ( self.topo, masses, self.sqrts, self.ana,
+                                "colliderbit", "recasting" )
         if not os.path.exists ( self.resultsFile ) or \
                  os.stat ( self.resultsFile ).st_size < 10:
             self.runCBS ()
+        if os.path.exists ( self.resultsFile ) and \
+                 os.stat ( self.resultsFile ).st_size >= 10:
+            self.journal.setState ( self.topo, masses, self.sqrts, self.ana,
+                    "colliderbit", "done", eff=self.resultsFile )
+        else:
+            self.journal.setState ( self.topo, masses, self.sqrts, self.ana,
+                    "colliderbit", "failed" )
         self.clean()
         return 0
 
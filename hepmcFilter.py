@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: hepmcFilter
+   :synopsis: a streaming filter of hepmc events on generator level, so
+              that events that do not fulfill an event condition do not
+              need to go through the detector simulation. the condition is
+              on the number of particles with a given pid, in the same way
+              as CutLangWrapper.filterDelphes counts Particle.PID.
+"""
+
+import os, sys, re, gzip
+from typing import Dict, Tuple
+
+def isGzip ( hepmcfile : str ) -> bool:
+    return hepmcfile.endswith ( ".gz" )
+
+class EventFilter:
+    def __init__ ( self, condition : Dict[int,int] ):
+        """
+        :param condition: dictionary of pid -> number of particles, e.g.
+                          { 25: 1 } for exactly one higgs
+        """
+        self.condition = condition
+        self.ntotal, self.npass = 0, 0
+        self.patterns = self.compile ( 2 )
+
+    def compile ( self, version : int ) -> Dict:
+        """ the regular expressions of the particle lines with a given pid.
+        the pid is the third token in hepmc2, the fourth in hepmc3 """
+        skip = rb"\S+ " if version == 2 else rb"\S+ \S+ "
+        return { re.compile ( rb"^P " + skip + str(pid).encode() + rb" ", re.M ): n \
+                 for pid, n in self.condition.items() }
+
+    def passes ( self, event : bytes ) -> bool:
+        """ does the event fulfill the condition? """
+        for pattern, n in self.patterns.items():
+            if len ( pattern.findall ( event ) ) != n:
+                return False
+        return True
+
+    def run ( self, infile, outfile, blocksize : int = 1 << 20 ) -> Tuple[int,int]:
+        """ copy the header, the events that pass, and the footer from
+        infile to outfile, both opened in binary mode. events are cut out
+        of large blocks, nothing is parsed line by line.
+        :returns: the number of events before, and after the filter
+        """
+        buf, header = b"", None
+        for chunk in iter ( lambda: infile.read ( blocksize ), b"" ):
+            buf += chunk
+            if header == None:
+                p = buf.find ( b"\nE " )
+                if p < 0:
+                    continue
+                header, buf = buf[:p+1], buf[p+1:]
+                if b"HepMC::Asciiv3" in header:
+                    self.patterns = self.compile ( 3 )
+                outfile.write ( header )
+            start = 0
+            while True:
+                p = buf.find ( b"\nE ", start + 1 )
+                if p < 0:
+                    break
+                self.event ( buf[start:p+1], outfile )
+                start = p + 1
+            buf = buf[start:]
+        if header == None: ## no events at all
+            outfile.write ( buf )
+            return self.ntotal, self.npass
+        ## the last event is followed by the footer
+        p = buf.find ( b"\nHepMC::" )
+        if p < 0:
+            p = len(buf) - 1
+        if p > 0:
+            self.event ( buf[:p+1], outfile )
+        outfile.write ( buf[p+1:] )
+        return self.ntotal, self.npass
+
+    def event ( self, event : bytes, outfile ):
+        self.ntotal += 1
+        if self.passes ( event ):
+            self.npass += 1
+            outfile.write ( event )
+
+def filterHepmc ( hepmcfile : str, outname : str,
+                  condition : Dict[int,int] ) -> Tuple[int,int]:
+    """ filter hepmcfile, gzipped or not, into outname, a file or a
+    named pipe.
+    :returns: the number of events before, and after the filter
+    """
+    opener = gzip.open if isGzip ( hepmcfile ) else open
+    with opener ( hepmcfile, "rb" ) as f:
+        with open ( outname, "wb" ) as out:
+            return EventFilter ( condition ).run ( f, out )
+
+def streamFiltered ( hepmcfile : str, condition : Dict[int,int],
+                     stream = None ):
+    """ filter hepmcfile into an anonymous pipe in a background thread,
+    see bakeryHelpers.streamToPipe. the read end is meant as the standard
+    input of delphes.
+
+    :param stream: read the decompressed events of hepmcfile from this
+                   stream instead, anything with a fileno, e.g. a
+                   hepmcStream.Stream. it is not closed.
+
+    :returns: the read end and the feeding thread, to be handed to
+              bakeryHelpers.closePipe, and the event filter, which has the
+              counts once the thread is done
+    """
+    import bakeryHelpers
+    evfilter = EventFilter ( condition )
+    opener = gzip.open if isGzip ( hepmcfile ) else open
+    if stream != None:
+        opener = lambda name, mode: os.fdopen ( stream.fileno(), mode, closefd = False )
+    def feed ( out ):
+        with opener ( hepmcfile, "rb" ) as f:
+            evfilter.run ( f, out )
+    rfd, feeder = bakeryHelpers.streamToPipe ( feed )
+    return rfd, feeder, evfilter
+
+if __name__ == "__main__":
+    import argparse, ast
+    argparser = argparse.ArgumentParser(description='filter hepmc events by the number of particles of given pids.')
+    argparser.add_argument ( 'hepmcfile', help='the hepmc file, gzipped or not' )
+    argparser.add_argument ( '-o', '--outfile', help='the filtered hepmc file [filtered.hepmc]',
+                             type=str, default="filtered.hepmc" )
+    argparser.add_argument ( '-c', '--condition', help='the event condition, as dictionary of pid to number of particles [{25:1}]',
+                             type=str, default="{25:1}" )
+    args = argparser.parse_args()
+    ntotal, npass = filterHepmc ( args.hepmcfile, args.outfile,
+                                  ast.literal_eval ( args.condition ) )
+    print ( f"[hepmcFilter] {npass}/{ntotal} events pass" )
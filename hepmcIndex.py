@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: hepmcIndex
+   :synopsis: a sidecar index for the hepmc.gz files in mg5results/, with the
+              number of events, the offsets of the events, the cross section
+              and a checksum. when the index is built, the file is rewritten
+              as a multi-member gzip file with one member per block of
+              events, so that every block starts at a gzip seek point.
+              the result is still a valid gzip file for every reader.
+"""
+
+import os, sys, re, gzip, json, hashlib, colorama
+from typing import Dict, List, Union
+
+__blocksize__ = 1000 ## events per gzip member
+__compresslevel__ = 6 ## zlib's default, level 9 costs a lot more for little
+__eventline__ = re.compile ( rb"^E ", re.M )
+__xsecline__ = re.compile ( rb"^(?:C |A \S+ GenCrossSection )[^\n]*", re.M )
+
+def indexFileName ( hepmcfile : str ) -> str:
+    """ the name of the index of hepmcfile """
+    return hepmcfile + ".idx"
+
+def error ( *msg ):
+    print ( "%s[hepmcIndex] %s%s" % ( colorama.Fore.RED, " ".join ( msg ), \
+               colorama.Fore.RESET ) )
+
+def parseXsec ( line : str ) -> Union[None,tuple]:
+    """ the cross section and its error in pb, from a hepmc2 "C" line or a
+    hepmc3 "A ... GenCrossSection" line, None if line has none """
+    tokens = line.split()
+    try:
+        if tokens[0] == "C" and len(tokens) >= 3:
+            return float(tokens[1]), float(tokens[2])
+        if tokens[0] == "A" and len(tokens) >= 5 and tokens[2] == "GenCrossSection":
+            return float(tokens[3]), float(tokens[4])
+    except ValueError as e:
+        pass
+    return None
+
+def build ( hepmcfile : str, blocksize : int = __blocksize__,
+            readsize : int = 1 << 20 ) -> Dict:
+    """ index hepmcfile, in one pass. the file is rewritten with a gzip
+    member per blocksize events, then the index is written next to it.
+    the events are found in blocks of readsize decompressed bytes, nothing
+    is copied line by line.
+    :returns: the index
+    """
+    tmpfile = f"{hepmcfile}.{os.getpid()}"
+    blocks, offsets = [], []
+    nevents, xsec, inblock = 0, None, 0
+    try:
+        with open ( tmpfile, "wb" ) as out:
+            newMember = lambda: gzip.GzipFile ( fileobj = out, mode = "wb",
+                                    compresslevel = __compresslevel__ )
+            member = newMember()
+            with gzip.open ( hepmcfile, "rb" ) as f:
+                buf = b""
+                for chunk in iter ( lambda: f.read ( readsize ), b"" ):
+                    buf += chunk
+                    ## complete lines only, the rest waits for the next chunk
+                    cut = buf.rfind ( b"\n" ) + 1
+                    work, buf = buf[:cut], buf[cut:]
+                    for m in __xsecline__.finditer ( work ):
+                        x = parseXsec ( m.group(0).decode ( "latin1" ) )
+                        if x != None:
+                            xsec = x ## the last estimate is the best one
+                    pos = 0
+                    for m in __eventline__.finditer ( work ):
+                        start = m.start()
+                        if nevents % blocksize == 0:
+                            ## the header lines stay in a member of their own
+                            member.write ( work[pos:start] )
+                            member.close()
+                            blocks.append ( out.tell() )
+                            member = newMember()
+                            inblock, pos = 0, start
+                        offsets.append ( inblock + start - pos )
+                        nevents += 1
+                    member.write ( work[pos:] )
+                    inblock += len(work) - pos
+                member.write ( buf )
+            member.close()
+        os.rename ( tmpfile, hepmcfile )
+    finally:
+        if os.path.exists ( tmpfile ):
+            os.unlink ( tmpfile )
+    h = hashlib.sha1()
+    with open ( hepmcfile, "rb" ) as f:
+        for chunk in iter ( lambda: f.read ( 1 << 20 ), b"" ):
+            h.update ( chunk )
+    stat = os.stat ( hepmcfile )
+    index = { "nevents": nevents, "blocksize": blocksize, "blocks": blocks,
+              "offsets": offsets, "xsec": None, "xsecerr": None,
+              "sha1": h.hexdigest(), "size": stat.st_size,
+              "mtime": stat.st_mtime }
+    if xsec != None:
+        index["xsec"], index["xsecerr"] = xsec
+    tmpindex = f"{indexFileName(hepmcfile)}.{os.getpid()}"
+    try:
+        with open ( tmpindex, "wt" ) as f:
+            json.dump ( index, f )
+            f.close()
+        os.rename ( tmpindex, indexFileName ( hepmcfile ) )
+    finally:
+        if os.path.exists ( tmpindex ):
+            os.unlink ( tmpindex )
+    return index
+
+class HepmcIndex:
+    def __init__ ( self, hepmcfile : str ):
+        """
+        :param hepmcfile: the hepmc.gz file
+        :raises: FileNotFoundError or ValueError, if there is no index, or
+                 if it does not belong to the current hepmcfile
+        """
+        self.hepmcfile = hepmcfile
+        with open ( indexFileName ( hepmcfile ), "rt" ) as f:
+            self.index = json.load ( f )
+            f.close()
+        stat = os.stat ( hepmcfile )
+        if stat.st_size != self.index["size"] or stat.st_mtime != self.index["mtime"]:
+            raise ValueError ( f"index of {hepmcfile} is stale" )
+        self.nevents = self.index["nevents"]
+        self.xsec = self.index["xsec"]
+
+    def verify ( self ) -> bool:
+        """ does the checksum of the file match the index? """
+        h = hashlib.sha1()
+        with open ( self.hepmcfile, "rb" ) as f:
+            for chunk in iter ( lambda: f.read ( 1 << 20 ), b"" ):
+                h.update ( chunk )
+        return h.hexdigest() == self.index["sha1"]
+
+    def events ( self, k : int, n : int = 1 ) -> List[str]:
+        """ read n events, starting with event k (0-indexed). only the
+        gzip members of these events get decompressed.
+        :returns: list of the events, as text
+        """
+        if k < 0 or k >= self.nevents:
+            raise IndexError ( f"event {k} out of range, we have {self.nevents}" )
+        n = min ( n, self.nevents - k )
+        blocksize = self.index["blocksize"]
+        ret, current = [], None
+        with open ( self.hepmcfile, "rb" ) as raw:
+            raw.seek ( self.index["blocks"][k // blocksize] )
+            ## the decompressor continues into the next members by itself
+            with gzip.GzipFile ( fileobj = raw, mode = "rb" ) as f:
+                f.seek ( self.index["offsets"][k] )
+                for line in f:
+                    if line.startswith ( b"E " ):
+                        if len(ret) == n:
+                            break
+                        current = []
+                        ret.append ( current )
+                    elif line.startswith ( b"HepMC::" ):
+                        break
+                    current.append ( line.decode ( "latin1" ) )
+        return [ "".join ( e ) for e in ret ]
+
+def load ( hepmcfile : str ) -> Union[None,HepmcIndex]:
+    """ the index of hepmcfile, None if there is none or if it is stale """
+    try:
+        return HepmcIndex ( hepmcfile )
+    except ( FileNotFoundError, ValueError, KeyError, json.JSONDecodeError ) as e:
+        return None
+
+def nEvents ( hepmcfile : str ) -> int:
+    """ the number of events of hepmcfile, from the index if we have one,
+    else the index gets built """
+    index = load ( hepmcfile )
+    if index != None:
+        return index.nevents
+    return build ( hepmcfile )["nevents"]
+
+if __name__ == "__main__":
+    import argparse
+    argparser = argparse.ArgumentParser(description='index hepmc.gz files.')
+    argparser.add_argument ( 'files', help='the hepmc.gz files', nargs='+' )
+    argparser.add_argument ( '-f', '--force', help='rebuild the index, even if it is up to date',
+                             action="store_true" )
+    argparser.add_argument ( '-v', '--verify', help='verify the checksums',
+                             action="store_true" )
+    args = argparser.parse_args()
+    for hepmcfile in args.files:
+        index = load ( hepmcfile )
+        if index == None or args.force:
+            build ( hepmcfile )
+            index = load ( hepmcfile )
+        line = f"{hepmcfile}: {index.nevents} events, xsec {index.xsec} pb"
+        if args.verify:
+            line += f", checksum {'ok' if index.verify() else 'MISMATCH'}"
+        print ( line )
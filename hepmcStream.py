@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: hepmcStream
+   :synopsis: decompress a hepmc.gz file once, and feed the events to several
+              concurrent delphes runs through anonymous pipes, which they read
+              as their standard input. the slowest consumer sets the pace.
+"""
+
+import os, sys, gzip, select, threading
+from typing import List, Union
+
+class Stream:
+    def __init__ ( self, fanout, i : int ):
+        """ the pipe of consumer i of fanout. it can be given as stdin to
+        subprocess, it stays the fanout's, the consumer must not close it.
+        """
+        self.fanout = fanout
+        self.i = i
+
+    def fileno ( self ) -> int:
+        """ the read end of the pipe """
+        return self.fanout.streams[self.i]
+
+    def complete ( self ) -> bool:
+        """ did the consumer get the whole file? meaningful once it has seen
+        the end of the stream: a feeder that fails closes the pipes, too. """
+        return self.fanout.exception == None
+
+    def release ( self ):
+        """ the consumer is done, stop feeding it """
+        self.fanout.release ( self.i )
+
+class FanOut:
+    def __init__ ( self, hepmcfile : str, nconsumers : int,
+                   blocksize : int = 1 << 20 ):
+        """ create the pipes, and start feeding them in a thread.
+        every consumer must either read its pipe to the end, or be
+        released when it is done.
+
+        :param hepmcfile: the hepmc.gz file
+        :param nconsumers: the number of pipes, one per consumer
+        :param blocksize: number of decompressed bytes that are fed at once
+        """
+        self.hepmcfile = hepmcfile
+        self.blocksize = blocksize
+        self.released = set()
+        self.exception = None
+        self.streams, self.fds = [], {}
+        for i in range(nconsumers):
+            rfd, wfd = os.pipe()
+            os.set_blocking ( wfd, False )
+            self.streams.append ( rfd )
+            self.fds[i] = wfd
+        self.feeder = threading.Thread ( target = self.feed, daemon = True )
+        self.feeder.start()
+
+    def stream ( self, i : int ) -> Stream:
+        """ the stream of consumer i, e.g. the stdin of a tool """
+        return Stream ( self, i )
+
+    def release ( self, i : int ):
+        """ consumer i is done, stop feeding it """
+        self.released.add ( i )
+
+    def feed ( self ):
+        """ decompress the file once, and write every block to all pipes.
+        a block is done when all consumers that are not released took it.
+        a consumer that closed its pipe counts as released. whatever
+        happens, the pipes get closed, so no consumer waits forever. """
+        try:
+            with gzip.open ( self.hepmcfile, "rb" ) as f:
+                for block in iter ( lambda: f.read ( self.blocksize ), b"" ):
+                    self.write ( block )
+                    if len ( self.released ) == len ( self.fds ):
+                        break
+        except Exception as e: ## e.g. a truncated file
+            self.exception = e
+        finally:
+            ## the consumers see the end of the file when we close. what is
+            ## still in the pipes stays readable.
+            for fd in self.fds.values():
+                os.close ( fd )
+
+    def write ( self, block : bytes ):
+        """ write block to all pipes that are not released """
+        todo = { i: memoryview(block) for i in self.fds }
+        while len(todo) > 0:
+            for i in list ( todo.keys() ):
+                if i in self.released:
+                    todo.pop ( i )
+            if len(todo) == 0:
+                break
+            fds = { self.fds[i]: i for i in todo }
+            _, writable, _ = select.select ( [], list(fds.keys()), [], 1. )
+            for fd in writable:
+                i = fds[fd]
+                try:
+                    written = os.write ( fd, todo[i][:65536] )
+                except BlockingIOError as e:
+                    continue
+                except BrokenPipeError as e: ## the consumer stopped reading
+                    self.release ( i )
+                    todo.pop ( i )
+                    continue
+                todo[i] = todo[i][written:]
+                if len(todo[i]) == 0:
+                    todo.pop ( i )
+
+    def close ( self ):
+        """ release all consumers, wait for the feeder, close the pipes.
+        :raises: the exception of the feeder, if it failed
+        """
+        for i in self.fds:
+            self.release ( i )
+        self.feeder.join()
+        for rfd in self.streams:
+            os.close ( rfd )
+        if self.exception != None:
+            raise IOError ( f"could not feed {self.hepmcfile}: {self.exception}" )
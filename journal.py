@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: journal
+   :synopsis: a sqlite database per base directory, that records the state
+              of every (topo, masses, analysis, recaster) job of a campaign,
+              so that a campaign can be resumed after an interruption.
+"""
+
+import os, sys, time, socket, sqlite3, json, ast, colorama
+import bakeryHelpers
+from typing import Dict, List, Union
+
+## the states a job can be in, in the order in which they are traversed
+states = [ "queued", "generating", "generated", "recasting", "done", "failed" ]
+
+def massesKey ( masses ) -> str:
+    """ the canonical string for a mass tuple, e.g. "(1000,100)".
+    :param masses: tuple or list of masses, or their string representation
+    """
+    if type(masses) == str:
+        masses = ast.literal_eval ( masses )
+    return str(tuple(masses)).replace(" ","")
+
+def recasterKey ( recaster ) -> str:
+    """ the canonical name of a recaster, or of several, e.g. "MA5" -> "ma5",
+    [ "MA5", "adl" ] -> "adl,ma5". all wrappers write the same key. """
+    if type(recaster) in [ list, tuple ]:
+        recaster = ",".join ( recaster )
+    names = set ( [ r.strip().lower() for r in recaster.split(",") ] )
+    return ",".join ( sorted ( names - { "" } ) )
+
+def analysisKey ( analysis : str ) -> str:
+    """ the canonical name of an analysis, or of a comma separated list,
+    e.g. "CMS-SUS-16-039,atlas_susy_2016_07" ->
+    "atlas_susy_2016_07,cms_sus_16_039" """
+    names = set ( [ a.strip().lower().replace("-","_") for a in analysis.split(",") ] )
+    return ",".join ( sorted ( names - { "" } ) )
+
+def sqrtsKey ( sqrts ):
+    """ sqrts in TeV, as int where it is integral, e.g. 13. -> 13 """
+    sqrts = float ( sqrts )
+    return int ( sqrts ) if sqrts.is_integer() else sqrts
+
+def jobKey ( topo : str, masses, sqrts, analysis : str, recaster ) -> tuple:
+    """ the primary key of a job in the jobs table """
+    return ( topo, massesKey(masses), sqrtsKey(sqrts), analysisKey(analysis),
+             recasterKey(recaster) )
+
+class Journal:
+    def __init__ ( self, basedir = None ):
+        """
+        :param basedir: the directory of the journal.db file,
+                        if None, then bakeryHelpers.baseDir()
+        """
+        if basedir == None:
+            basedir = bakeryHelpers.baseDir()
+        self.dbfile = os.path.join ( basedir, "journal.db" )
+        self.create()
+
+    def error ( self, *msg ):
+        print ( "%s[journal] %s%s" % ( colorama.Fore.RED, " ".join ( msg ), \
+                   colorama.Fore.RESET ) )
+
+    def connect ( self ):
+        """ connect to the database. many processes write concurrently,
+        so we wait generously for the database lock. """
+        return sqlite3.connect ( self.dbfile, timeout = 300 )
+
+    def create ( self ):
+        """ create the jobs table, if it does not exist """
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( """CREATE TABLE IF NOT EXISTS jobs (
+                    topo TEXT, masses TEXT, sqrts INTEGER, analysis TEXT,
+                    recaster TEXT, state TEXT, attempts INTEGER DEFAULT 0,
+                    host TEXT, pid INTEGER, created REAL, started REAL,
+                    finished REAL, artifacts TEXT DEFAULT '{}',
+                    PRIMARY KEY ( topo, masses, sqrts, analysis, recaster ) )""" )
+        finally:
+            conn.close()
+
+    def enqueue ( self, topo : str, masses : List, sqrts : int,
+                  analysis : str, recaster : str ):
+        """ record the mass points of a campaign as queued.
+        points that are already in the journal are left untouched.
+
+        :param masses: list of mass tuples
+        """
+        now = time.time()
+        rows = [ jobKey ( topo, m, sqrts, analysis, recaster ) + ( "queued", now ) \
+                 for m in masses ]
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany ( "INSERT OR IGNORE INTO jobs (topo,masses,sqrts,analysis,recaster,state,created) VALUES (?,?,?,?,?,?,?)", rows )
+        except sqlite3.Error as e:
+            self.error ( f"could not enqueue {len(rows)} points: {e}" )
+        finally:
+            conn.close()
+
+    def setState ( self, topo : str, masses, sqrts : int, analysis : str,
+                   recaster : str, state : str, **artifacts ):
+        """ record the state of a job, in one transaction. entering
+        "generating" or "recasting" counts as an attempt. a failure to write
+        to the journal is reported, but never stops the job itself.
+
+        :param state: one of journal.states
+        :param artifacts: paths to the files that the job produced,
+                          e.g. hepmc="mg5results/T2_1000_100.13.hepmc.gz"
+        """
+        if not state in states:
+            self.error ( f"unknown state {state}" )
+            return
+        key = jobKey ( topo, masses, sqrts, analysis, recaster )
+        now = time.time()
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( "INSERT OR IGNORE INTO jobs (topo,masses,sqrts,analysis,recaster,state,created) VALUES (?,?,?,?,?,?,?)", key + ( state, now ) )
+                row = conn.execute ( "SELECT artifacts FROM jobs WHERE topo=? AND masses=? AND sqrts=? AND analysis=? AND recaster=?", key ).fetchone()
+                arts = json.loads ( row[0] ) if row[0] else {}
+                arts.update ( { k: str(v) for k,v in artifacts.items() } )
+                conn.execute ( "UPDATE jobs SET state=?, artifacts=? WHERE topo=? AND masses=? AND sqrts=? AND analysis=? AND recaster=?",
+                        ( state, json.dumps ( arts ) ) + key )
+                if state in [ "generating", "recasting" ]:
+                    conn.execute ( "UPDATE jobs SET attempts=attempts+1, host=?, pid=?, started=?, finished=NULL WHERE topo=? AND masses=? AND sqrts=? AND analysis=? AND recaster=?",
+                        ( socket.gethostname(), os.getpid(), now ) + key )
+                if state in [ "done", "failed" ]:
+                    conn.execute ( "UPDATE jobs SET finished=? WHERE topo=? AND masses=? AND sqrts=? AND analysis=? AND recaster=?",
+                        ( now, ) + key )
+        except sqlite3.Error as e:
+            self.error ( f"could not set {key} to {state}: {e}" )
+        finally:
+            conn.close()
+
+    def getState ( self, topo : str, masses, sqrts : int, analysis : str,
+                   recaster : str ) -> Union[None,str]:
+        """ the state of a job, None if the journal does not know it """
+        key = jobKey ( topo, masses, sqrts, analysis, recaster )
+        conn = self.connect()
+        try:
+            row = conn.execute ( "SELECT state FROM jobs WHERE topo=? AND masses=? AND sqrts=? AND analysis=? AND recaster=?", key ).fetchone()
+        finally:
+            conn.close()
+        if row == None:
+            return None
+        return row[0]
+
+    def unfinished ( self, topo : str, sqrts : int, analysis : str,
+                     recaster : str ) -> List:
+        """ the mass points of a campaign that are not yet done,
+        in the order in which they were queued.
+
+        :returns: list of mass tuples
+        """
+        conn = self.connect()
+        try:
+            rows = conn.execute ( "SELECT masses FROM jobs WHERE topo=? AND sqrts=? AND analysis=? AND recaster=? AND state!='done' ORDER BY created",
+                    ( topo, sqrtsKey(sqrts), analysisKey(analysis), recasterKey(recaster) ) ).fetchall()
+        finally:
+            conn.close()
+        return [ ast.literal_eval ( r[0] ) for r in rows ]
+
+    def summary ( self, topo : Union[None,str] = None ) -> Dict:
+        """ count the jobs per state
+
+        :param topo: if given, count only jobs of this topology
+        :returns: dictionary of state -> number of jobs
+        """
+        query = "SELECT state, COUNT(*) FROM jobs"
+        params = ()
+        if topo != None:
+            query += " WHERE topo=?"
+            params = ( topo, )
+        conn = self.connect()
+        try:
+            rows = conn.execute ( query + " GROUP BY state", params ).fetchall()
+        finally:
+            conn.close()
+        return dict ( rows )
+
+if __name__ == "__main__":
+    import argparse
+    argparser = argparse.ArgumentParser(description='show the campaign journal')
+    argparser.add_argument ( '-T', '--topo', help='show only this topology [None]',
+                             type=str, default=None )
+    args = argparser.parse_args()
+    j = Journal()
+    for state, n in j.summary ( args.topo ).items():
+        print ( f"{state:>10s}: {n}" )
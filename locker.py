@@ -10,13 +10,23 @@
 """
 
 import os, sys, subprocess, time, socket, random, colorama
-import signal
+import signal, threading
 import bakeryHelpers
+import hepmcIndex
 
 __locks__ = set()
+## the locks that we handed over to another process, see Locker.handOver.
+## we renew them until they are adopted, but never remove them.
+__handedOver__ = set()
+## a lock is a lease: its holder touches the lock file every __heartbeat__
+## seconds. a lock file that has not been touched for __leasetime__ seconds
+## is considered abandoned, and can be reclaimed by anyone.
+__heartbeat__ = 60
+__leasetime__ = 600
+__heartbeatThread__ = { "pid": None, "thread": None }
 
 def signal_handler(sig, frame):
-    print('You pressed Ctrl+C, remove all locks!')
+    print( f'Caught signal {sig}, remove all locks!' )
     for l in __locks__:
         cmd = "rm -f %s" % l
         subprocess.getoutput ( cmd )
@@ -24,6 +34,34 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 signal.signal(signal.SIGINT, signal_handler)
+## slurm preempts jobs with SIGTERM
+signal.signal(signal.SIGTERM, signal_handler)
+
+def heartbeat():
+    """ renew the leases of all locks held by this process """
+    while True:
+        time.sleep ( __heartbeat__ )
+        for l in list(__locks__):
+            try:
+                os.utime ( l )
+            except OSError as e:
+                pass
+        for l in list(__handedOver__):
+            try:
+                os.utime ( l )
+            except OSError as e:
+                ## the adopter is done with it
+                __handedOver__.discard ( l )
+
+def startHeartbeat():
+    """ start the heartbeat thread, once per process. needs to be
+    checked per process, as forked children do not inherit threads. """
+    if __heartbeatThread__["pid"] == os.getpid():
+        return
+    t = threading.Thread ( target = heartbeat, daemon = True )
+    t.start()
+    __heartbeatThread__["pid"] = os.getpid()
+    __heartbeatThread__["thread"] = t
 
 class Locker:
     def __init__ ( self, sqrts, topo, ignore_locks, prefix=".lock" ):
@@ -58,44 +96,95 @@ class Locker:
         ret = f"{self.basedir}/{self.prefix}{self.sqrts}_{m}_{self.topo}"
         return ret
 
+    def isExpired ( self, filename ):
+        """ has the lease on lock file <filename> expired, i.e. has
+        its holder not renewed it for __leasetime__ seconds? """
+        try:
+            dt = time.time() - os.stat ( filename ).st_mtime
+        except FileNotFoundError as e:
+            return True
+        return dt > __leasetime__
+
     def isLocked ( self, masses ):
         """ a simple query if a point is locked, but does not lock itself. 
-        Orphaned lockfiles (3 hours after creation) get removed.
+        Expired leases do not count as locks.
         """
         filename = self.lockfile( masses )
         if not os.path.exists ( filename ):
             return False
-        m = os.stat ( filename )
-        ## dt is time since creation, in hours
-        dt = ( time.time () - m.st_ctime  ) / 60. / 60.
-        if dt > 3: # after 3 hours, remove lock
-            self.unlock ( masses )
+        return not self.isExpired ( filename )
+
+    def reclaim ( self, filename ):
+        """ remove an expired lock file. the file is first renamed,
+        so that of several processes only one can reclaim it. """
+        if not self.isExpired ( filename ):
+            return False
+        stale = f"{filename}.stale.{socket.gethostname()}.{os.getpid()}"
+        try:
+            os.rename ( filename, stale )
+        except FileNotFoundError as e:
             return False
+        if not self.isExpired ( stale ):
+            ## someone else reclaimed it just before us, give it back
+            os.rename ( stale, filename )
+            return False
+        self.info ( f"reclaiming expired lock {filename}" )
+        os.unlink ( stale )
         return True
 
     def lock ( self, masses ):
         """ lock for topo and masses, to make sure processes dont
-            overwrite each other
+            overwrite each other. the lock file is created atomically,
+            and kept alive by a heartbeat until unlocked.
         :returns: True if there is already a lock on it
         """
         if self.ignore_locks:
             return False
         filename = self.lockfile( masses )
-        __locks__.add ( filename )
-        if os.path.exists ( filename ):
-            return True
         for i in range(5):
             try:
-                with open ( filename, "wt" ) as f:
-                    f.write ( time.asctime()+","+socket.gethostname()+"\n" )
+                fd = os.open ( filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY )
+                with os.fdopen ( fd, "wt" ) as f:
+                    f.write ( f"{time.asctime()},{socket.gethostname()},{os.getpid()}\n" )
                     f.close()
+                __locks__.add ( filename )
+                startHeartbeat()
                 return False
+            except FileExistsError as e:
+                if not self.reclaim ( filename ):
+                    return True
             except FileNotFoundError as e:
                 t0 = random.uniform(2.,4.*i)
                 self.msg ( "FileNotFoundError #%d %s. Sleep for %.1fs" % ( i, e, t0 ) )
                 time.sleep( t0 )
         return True ## pretend there is a lock
 
+    def adopt ( self, masses ):
+        """ take over the lease of a point that another process locked for
+        us, e.g. a generator that handed the point to a recaster. from now
+        on the heartbeat of this process renews it. """
+        if self.ignore_locks:
+            return
+        filename = self.lockfile( masses )
+        try:
+            os.utime ( filename )
+        except FileNotFoundError as e:
+            self.error ( f"lock {filename} is gone, cannot adopt it" )
+            return
+        __locks__.add ( filename )
+        startHeartbeat()
+
+    def handOver ( self, masses ):
+        """ hand the lock of a point over to another process, which will
+        adopt it. the lock is no longer ours to remove, not even when we
+        get killed, but our heartbeat renews it while it is in transit. """
+        if self.ignore_locks:
+            return
+        filename = self.lockfile( masses )
+        if filename in __locks__:
+            __locks__.remove ( filename )
+            __handedOver__.add ( filename )
+
     def unlock ( self, masses ):
         """ unlock for topo and masses, to make sure processes dont
             overwrite each other """
@@ -104,6 +193,7 @@ class Locker:
         filename = self.lockfile( masses )
         if filename in __locks__:
             __locks__.remove ( filename )
+        __handedOver__.discard ( filename )
         if os.path.exists ( filename ):
             cmd = "rm -f %s" % filename
             subprocess.getoutput ( cmd )
@@ -123,6 +213,9 @@ class Locker:
         hepmcfile = self.hepmcFileName( masses )
         if not os.path.exists ( hepmcfile ):
             return False
+        index = hepmcIndex.load ( hepmcfile )
+        if index != None:
+            return index.nevents >= bakeryHelpers.constants["minimumNrOfEvents"]
         if os.stat ( hepmcfile ).st_size < 100:
             ## too small to be real
             return False
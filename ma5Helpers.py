@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: ma5Helpers
+        :synopsis: streaming parsers for the outputs of MadAnalysis5: the
+                   CLs_output_summary.dat files and the Cutflows/*.saf files.
+
+.. moduleauthor:: Wolfgang Waltenberger <wolfgang.waltenberger@gmail.com>
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union, Iterator, NamedTuple
+
+class RegionRecord ( NamedTuple ):
+    """ one line of a summary file """
+    dataset : str
+    analysis : str
+    region : str
+    eff : float
+    statunc : Union[None,float] = None
+    sig95exp : Union[None,float] = None
+    sig95obs : Union[None,float] = None
+
+class CutflowRecord ( NamedTuple ):
+    """ the initial and the final counts of the cutflow of one region """
+    region : str
+    nevents : float
+    sumw : float
+    sumw2 : float
+    final_nevents : float
+    final_sumw : float
+    final_sumw2 : float
+
+def parseSummaryLine ( line : str ) -> Union[None,RegionRecord]:
+    """ parse one line of a summary file. lines with 10, 8, 7 or 5 tokens
+    are understood, the latter being the efficiencies-only summaries.
+
+    :returns: None for comments, empty lines and control regions
+    :raises: ValueError, if the line cannot be parsed
+    """
+    p = line.find("#")
+    if p >= 0:
+        line = line[:p]
+    line = line.strip()
+    if len(line) == 0 or "control region" in line:
+        return None
+    line = line.replace ( "signal region", "signal_region" )
+    line = line.replace ( "150-1", "150 -1" )
+    tokens = line.split()
+    if len(tokens) == 10:
+        dsname, ananame, sr, sig95exp, sig95obs, pp, eff, statunc, systunc, totunc = tokens
+    elif len(tokens) == 8:
+        dsname, ananame, sr, sig95exp, sig95obs, pp, eff, statunc = tokens
+    elif len(tokens) == 7:
+        dsname, ananame, sr, sig95exp, pp, eff, statunc = tokens
+        sig95obs = None
+    elif len(tokens) == 5:
+        dsname, ananame, sr, eff, statunc = tokens
+        sig95exp, sig95obs = None, None
+    else:
+        raise ValueError ( f"got {len(tokens)} tokens, expected 5, 7, 8 or 10" )
+    toFloat = lambda x: None if x == None else float(x)
+    return RegionRecord ( dsname, ananame, sr, float(eff), toFloat(statunc),
+                          toFloat(sig95exp), toFloat(sig95obs) )
+
+def readSummary ( summaryfile : str ) -> Iterator[RegionRecord]:
+    """ stream the records of a summary file. lines that cannot be parsed
+    are reported and skipped. """
+    with open ( summaryfile, "rt" ) as f:
+        for line in f:
+            try:
+                record = parseSummaryLine ( line )
+            except ValueError as e:
+                print ( f"[ma5Helpers] In file {summaryfile}: cannot parse ``{line.strip()[:50]}'': {e}. skip it" )
+                continue
+            if record != None:
+                yield record
+
+def hasRecords ( summaryfile : str ) -> bool:
+    """ does summaryfile exist, and have at least one efficiency? ma5 may
+    write a summary with the header only. """
+    if not os.path.exists ( summaryfile ):
+        return False
+    for record in readSummary ( summaryfile ):
+        return True
+    return False
+
+def summaryEffs ( summaryfile : str ) -> Dict:
+    """ the efficiencies of a summary file
+    :returns: dictionary of analysis -> region -> efficiency
+    """
+    effs = {}
+    for record in readSummary ( summaryfile ):
+        if not record.analysis in effs:
+            effs[record.analysis] = {}
+        effs[record.analysis][record.region] = record.eff
+    return effs
+
+def readCutflow ( saffile : str ) -> Union[None,CutflowRecord]:
+    """ stream a cutflow file once, for its initial counts and the counts
+    after the last cut. the initial counts are the three lines following
+    "Initial number of events", the counts of a cut are the three lines
+    following the name of the cut, which follows <Counter>.
+
+    :returns: the record, None if the file is incomplete
+    """
+    region = os.path.splitext ( os.path.basename ( saffile ) )[0]
+    initial, last = None, None
+    current, skip, values = None, 0, []
+    with open ( saffile, "rt" ) as f:
+        for line in f:
+            if current != None:
+                if skip > 0:
+                    skip -= 1
+                    continue
+                try:
+                    values.append ( float ( line.split()[0] ) )
+                except ( IndexError, ValueError ) as e:
+                    print ( f"[ma5Helpers] error extracting the {current} weights from {saffile}: {e}" )
+                    current = None
+                    continue
+                if len(values) == 3:
+                    if current == "initial":
+                        initial = tuple(values)
+                    else:
+                        last = tuple(values)
+                    current = None
+                continue
+            if line.startswith ( '"Initial number of events"' ):
+                current, skip, values = "initial", 0, []
+            elif "<Counter>" in line and not "</Counter>" in line:
+                current, skip, values = "last", 1, []
+    if initial == None or last == None:
+        return None
+    return CutflowRecord ( region, *initial, *last )
+
+def readCutflows ( saffiles : List, nthreads : int = 8 ) -> List[CutflowRecord]:
+    """ read many cutflow files in parallel. files that are missing or
+    incomplete are reported and skipped.
+    :returns: list of records, in the order of saffiles
+    """
+    def read ( saffile ):
+        if not os.path.exists ( saffile ):
+            print ( f"[ma5Helpers] SAF file {saffile} does not exist!" )
+            return None
+        record = readCutflow ( saffile )
+        if record == None:
+            print ( f"[ma5Helpers] no weights extracted from {saffile}" )
+        return record
+    if nthreads < 2 or len(saffiles) < 2:
+        records = [ read ( s ) for s in saffiles ]
+    else:
+        with ThreadPoolExecutor ( max_workers = nthreads ) as pool:
+            records = list ( pool.map ( read, saffiles ) )
+    return [ r for r in records if r != None ]
+
+def mergeCutflows ( cutflows : List[CutflowRecord] ) -> List[CutflowRecord]:
+    """ merge the cutflows of independent chunks of the same sample: the
+    counts and the sums of weights of the same region are added up.
+    :returns: one record per region, in the order of first appearance
+    """
+    merged = {}
+    for c in cutflows:
+        if not c.region in merged:
+            merged[c.region] = c
+            continue
+        m = merged[c.region]
+        merged[c.region] = CutflowRecord ( c.region,
+            *[ a + b for a,b in zip ( m[1:], c[1:] ) ] )
+    return list ( merged.values() )
+
+def readSafBlocks ( saffile : str ) -> Dict[str,List[str]]:
+    """ the <Block> ... </Block> sections of a saf file
+    :returns: dictionary of block name -> lines, in the order of the file
+    """
+    blocks, block = {}, None
+    with open ( saffile, "rt" ) as f:
+        for line in f:
+            tag = line.strip()
+            if block == None:
+                if tag.startswith ( "<" ) and tag.endswith ( ">" ):
+                    block = tag[1:-1]
+                    blocks[block] = []
+                continue
+            if tag == f"</{block}>":
+                block = None
+                continue
+            blocks[block].append ( line )
+    return blocks
+
+def addGlobalInfos ( a : List[str], b : List[str] ) -> List[str]:
+    """ add up the numbers of events and the sums of weights of two
+    <SampleGlobalInfo> blocks, i.e. of the line following
+    "# xsection xsection_error nevents sum_weight+ sum_weight-".
+    the cross section is the one of a. """
+    values = [ l for l in b if not l.startswith ( "#" ) and len(l.split()) >= 5 ]
+    ret = []
+    for line in a:
+        tokens = line.split()
+        if line.startswith ( "#" ) or len(tokens) < 5 or len(values) == 0:
+            ret.append ( line )
+            continue
+        other = values.pop(0).split()
+        nevents = int ( float ( tokens[2] ) + float ( other[2] ) )
+        wplus = float ( tokens[3] ) + float ( other[3] )
+        wminus = float ( tokens[4] ) + float ( other[4] )
+        ret.append ( f"  {tokens[0]}  {tokens[1]}  {nevents}  {wplus:.6e}  {wminus:.6e}\n" )
+    return ret
+
+def mergeSampleInfos ( saffiles : List, outfile : str ) -> bool:
+    """ merge the sample files, e.g. defaultset.saf, of independent chunks
+    of the same sample into outfile: the numbers of events and the sums of
+    weights of <SampleGlobalInfo> are added up, the entries of <FileInfo>
+    and <SampleDetailedInfo> are concatenated.
+
+    :returns: False, if a file is missing
+    """
+    merged = None
+    for saffile in saffiles:
+        if not os.path.exists ( saffile ):
+            print ( f"[ma5Helpers] SAF file {saffile} does not exist!" )
+            return False
+        blocks = readSafBlocks ( saffile )
+        if merged == None:
+            merged = blocks
+            continue
+        for name, lines in blocks.items():
+            if not name in merged:
+                merged[name] = lines
+            elif name == "SampleGlobalInfo":
+                merged[name] = addGlobalInfos ( merged[name], lines )
+            elif name in [ "FileInfo", "SampleDetailedInfo" ]:
+                merged[name] += [ l for l in lines if not l.startswith ( "#" ) ]
+    if merged == None:
+        return False
+    with open ( outfile, "wt" ) as f:
+        for name, lines in merged.items():
+            f.write ( f"<{name}>\n" )
+            f.writelines ( lines )
+            f.write ( f"</{name}>\n\n" )
+        f.close()
+    return True
+
+def weightRecord ( cutflow : CutflowRecord ) -> Dict:
+    """ the weights of one region, in the form of MA5Wrapper.extract """
+    return { "SR": cutflow.region,
+             "__nevents__": cutflow.nevents,
+             "total_sum_weights": cutflow.sumw,
+             "total_sum_weights_squared": cutflow.sumw2,
+             "final_nevents": cutflow.final_nevents,
+             "final_sum_weights": cutflow.final_sumw,
+             "final_sum_weights_squared": cutflow.final_sumw2 }
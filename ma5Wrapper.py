@@ -8,22 +8,28 @@
 .. moduleauthor:: Wolfgang Waltenberger <wolfgang.waltenberger@gmail.com>
 """
 
-import os, sys, colorama, subprocess, shutil, tempfile, time, io, fcntl, json
+import os, sys, colorama, subprocess, shutil, tempfile, time, io, fcntl, json, glob
 import multiprocessing
 import bakeryHelpers
+import ma5Helpers
+import weightsStore
 import locker
+import journal
 
 class MA5Wrapper:
     def __init__ ( self, topo, njets, rerun, analyses, keep=False,
-                   sqrts=13, ver="1.10.12", keephepmc=True ):
+                   sqrts=13, ver="1.10.12", keephepmc=True, effsOnly=False ):
         """
         :param topo: e.g. T1
         :param keep: keep cruft files, for debugging
         :param sqrts: sqrts, in TeV
         :param ver: version of ma5
         :param keephepmc: keep mg5 hepmc file (typically in mg5results/)
+        :param effsOnly: skip the CLs computation, write the summary file
+                         with the efficiencies from the cutflows
         """
         self.topo = topo
+        self.effsOnly = effsOnly
         self.sqrts = sqrts
         self.njets = njets
         analyses = analyses.lower().replace("-","_")
@@ -34,6 +40,7 @@ class MA5Wrapper:
         self.basedir = bakeryHelpers.baseDir()
         os.chdir ( self.basedir )
         self.locker = locker.Locker ( sqrts, topo, False )
+        self.journal = journal.Journal ( self.basedir )
         self.ma5results = "%s/ma5results/" % self.basedir
         bakeryHelpers.mkdir ( self.ma5results )
         self.ma5install = "%s/ma5/" % self.basedir
@@ -150,6 +157,28 @@ class MA5Wrapper:
         """
         self.info ( "writing commandfile %s" % self.commandfile )
         f = open( self.commandfile,'wt')
+        self.writeCommandHeader ( f )
+        f.write('import '+hepmcfile+'\n')
+        f.write('submit ANA_%s\n' % bakeryHelpers.dirName( process, masses )  )
+        f.close()
+
+    def writeBatchCommandFile ( self, datasets, anadir ):
+        """ write the commands file for a session with many points.
+        :param datasets: dictionary of dataset name -> masses
+        :param anadir: the name of the output directory of ma5
+        """
+        self.info ( "writing commandfile %s for %d points" % ( self.commandfile, len(datasets) ) )
+        f = open( self.commandfile,'wt')
+        self.writeCommandHeader ( f )
+        for dsname, masses in datasets.items():
+            f.write ( 'import %s as %s\n' % ( self.locker.hepmcFileName ( masses ), dsname ) )
+        f.write ( 'submit %s\n' % anadir )
+        f.close()
+
+    def writeCommandHeader ( self, f ):
+        """ write the settings that precede the imports in a commands file
+        :param f: the open commands file
+        """
         ## FIXME here I should activate e.g. delphesMA5tune if needed
         if self.analyses in [ "atlas_susy_2013_02" ]:
             f.write('install delphesMA5tune\n')
@@ -174,9 +203,6 @@ class MA5Wrapper:
         self.info ( f"do we need a global likelihood for {self.analyses}: {bakeryHelpers.yesno(needsLLhd)}" )
         if not needsLLhd:
             f.write('set main.recast.global_likelihoods = off\n' )
-        f.write('import '+hepmcfile+'\n')
-        f.write('submit ANA_%s\n' % bakeryHelpers.dirName( process, masses )  )
-        f.close()
 
     def checkForSummaryFile ( self, masses ):
         """ given the process, and the masses, check summary file
@@ -245,7 +271,9 @@ class MA5Wrapper:
     
         if hasAllInfo:
             print("All necessary information is already available")
+            self.record ( masses, "done" )
             return {"exit_status": 1}
+        self.record ( masses, "recasting" )
 
         if not os.path.exists(hepmcfile):
             self.error ( "%scannot find hepmc file %s" % ( spid, hepmcfile ) )
@@ -254,6 +282,7 @@ class MA5Wrapper:
                 cmd = "rm -rf %s" % hepmcfile[:p]
                 o = subprocess.getoutput(cmd)
                 self.error ( "%sdeleting the folder %s: %s" % ( spid, cmd, o ) )
+            self.record ( masses, "failed" )
             return {"exit_status": -1}
         # now write recasting card
         self.msg ( "%s Found hepmcfile at %s" % ( spid, hepmcfile ) )
@@ -263,8 +292,7 @@ class MA5Wrapper:
         tempdir = "%s/ma5_%s" % ( self.basedir, Dir )
 
         a = subprocess.getoutput ( "mkdir %s" % tempdir )
-        a = subprocess.getoutput ( "cp -r %s/bin %s/madanalysis %s/tools %s" % \
-                                   ( self.ma5install, self.ma5install, self.ma5install, tempdir ) )
+        self.linkInstallation ( tempdir )
         a = subprocess.getoutput ( "mv %s %s/recast" % ( self.recastfile, tempdir ) )
         # a = subprocess.getoutput ( "cp -r %s %s" % ( self.recastfile, tempdir ) )
         a = subprocess.getoutput ( "mv %s %s/ma5cmd" % \
@@ -288,11 +316,17 @@ class MA5Wrapper:
         origdatfile = "%s/ANA_%s/Output/SAF/CLs_output_summary.dat" % \
                       ( tempdir, dirname )
         origdatfile = origdatfile.replace("//","/")
+        if self.effsOnly and not ma5Helpers.hasRecords ( origdatfile ):
+            ## no CLs, so no efficiencies from ma5: write them from the cutflows
+            self.writeEffsSummary ( os.path.dirname ( origsaffile ), origdatfile )
         errFree=True
 
         if not os.path.exists ( origdatfile ):
             errFree=False
             self.error ( "dat file %s does not exist!" % origdatfile )
+        elif self.effsOnly and not ma5Helpers.hasRecords ( origdatfile ):
+            errFree=False
+            self.error ( "dat file %s has no efficiencies!" % origdatfile )
         if not os.path.exists ( origsaffile ):
             errFree=False
             self.error ( "saf file %s does not exist!" % origsaffile )
@@ -300,18 +334,45 @@ class MA5Wrapper:
         # New SAF file processing
         saf_dir = f"{tempdir}/ANA_{self.topo}_{self.njets}jet.{smass}/Output/SAF/defaultset"
         
+        saf_files = self.safFilesOf ( origdatfile, saf_dir )
+        destdatfile = bakeryHelpers.datFile (  self.ma5results, self.topo, masses, self.sqrts )
+
+        if errFree: ## only move if we have both
+            shutil.move ( origdatfile, destdatfile )
+            shutil.move ( origsaffile, destsaffile )
+            if self.keephepmc:
+                self.info ( f"not removing {hepmcfile}" )
+            else:
+                cmd = f"rm -rf {hepmcfile}"
+                self.exe ( cmd )
+
+        self.writeWeightsOf ( masses, saf_files )
+
+        if errFree and not self.keep and os.path.exists ( tempdir ):
+            self.exe ( f"rm -rf {tempdir}" )
+        if False and not errFree: # skip this for now
+            ## for debugging
+            dirname = f"{self.basedir}/debug/"
+            bakeryHelpers.mkdir ( dirname )
+            self.exe ( f"mv {tempdir} {dirname}" )
+        os.chdir ( self.basedir )
+        if errFree:
+            self.record ( masses, "done", dat=destdatfile, saf=destsaffile )
+        else:
+            self.record ( masses, "failed" )
+        return {"exit_status": 0}
+
+    def safFilesOf ( self, datfile, saf_dir ):
+        """ the cutflow files of the signal regions in a summary file
+        :param saf_dir: the dataset directory, e.g. .../Output/SAF/defaultset
+        :returns: list of the saf files that exist
+        """
         signal_regions = {}
-        if os.path.exists(origdatfile):
-            with open(origdatfile, "r") as dat_file:
-                for line in dat_file:
-                    if line.startswith("#") or not line.strip():
-                        continue
-                    columns = line.split()
-                    analysis_name = columns[1]
-                    signal_region = columns[2]
-                    if analysis_name not in signal_regions:
-                        signal_regions[analysis_name] = []
-                    signal_regions[analysis_name].append(signal_region)
+        if os.path.exists(datfile):
+            for record in ma5Helpers.readSummary ( datfile ):
+                if record.analysis not in signal_regions:
+                    signal_regions[record.analysis] = []
+                signal_regions[record.analysis].append(record.region)
         print("Signal regions detected: ", signal_regions)
 
         saf_files = []
@@ -328,211 +389,340 @@ class MA5Wrapper:
                     print(f"SAF file {saf_file} does not exist!")
 
         print(f"SAF files collected: {saf_files}")
-       
-        destdatfile = bakeryHelpers.datFile (  self.ma5results, self.topo, masses, self.sqrts )
+        return saf_files
 
-        if errFree: ## only move if we have both
-            shutil.move ( origdatfile, destdatfile )
-            shutil.move ( origsaffile, destsaffile )
-            if self.keephepmc:
-                self.info ( f"not removing {hepmcfile}" )
-            else:
-                cmd = f"rm -rf {hepmcfile}"
-                self.exe ( cmd )
-
-        # Call the extract function
+    def writeWeightsOf ( self, masses, saf_files ):
+        """ extract the weights of the signal regions of one point from its
+        cutflows, and put them into the weights store """
         effs, weights, timestamp = self.extract(masses, saf_files) 
-        #print(f"Extracted effs: {effs}, weights: {weights}, timestamp: {timestamp}") 
+        if len(weights) == 0:
+            return
+        ## saf files are .../<analysis>/Cutflows/<region>.saf
+        analysis_name = os.path.basename ( os.path.dirname ( os.path.dirname ( saf_files[-1] ) ) )
+        SModelS_analysis_name = bakeryHelpers.ma5AnaNameToSModelSName ( analysis_name )
+        store = weightsStore.WeightsStore ( self.weightsdir )
+        store.put ( SModelS_analysis_name, self.topo, self.njets, masses, weights )
+
+    def runBatch ( self, massesList, pid=None ):
+        """ run MA5 over the hepmc files of many points in one session, one
+        dataset per point, so that start-up, analysis loading and
+        compilation are paid only once. the outputs are split back into
+        the files of the individual points, as with run.
+        :param massesList: list of mass tuples
+        :param pid: process id, for debugging
+        :returns: dictionary with the exit_status, -1 if problem occured,
+                  0 if all went smoothly, 1 if nothing needed to be done.
+        """
+        self.checkInstallation()
+        spid = ""
+        if pid is not None:
+            spid = "[%d]" % pid
+        process = "%s_%djet" % (self.topo, self.njets)
+        datasets = {} ## dataset name -> masses
+        for masses in massesList:
+            if self.checkForSummaryFile(masses):
+                self.record ( masses, "done" )
+                continue
+            hepmcfile = self.locker.hepmcFileName ( masses )
+            if not os.path.exists ( hepmcfile ):
+                self.error ( "%scannot find hepmc file %s" % ( spid, hepmcfile ) )
+                self.record ( masses, "failed" )
+                continue
+            self.record ( masses, "recasting" )
+            datasets[f"point{len(datasets)}"] = masses
+        if len(datasets) == 0:
+            return {"exit_status": 1}
+        self.msg ( "%s running %d points in one session" % ( spid, len(datasets) ) )
 
-        # Check if the weights  directory exists 
-        if not os.path.exists(self.weightsdir):
-            print(f"Creating the weights dir: {self.weightsdir}")
-            subprocess.getoutput(f"mkdir {self.weightsdir}")
-        else:
-            print(f"Weights dir already exists: {self.weightsdir}")
+        self.commandfile = tempfile.mktemp(prefix="ma5cmd", dir=self.ma5install)
+        self.teefile = tempfile.mktemp(prefix="ma5", suffix=".run", dir="/tmp")
+        self.writeRecastingCard()
+        tempdir = tempfile.mkdtemp ( prefix=f"ma5_{process}.batch", dir=self.basedir )
+        anadir = f"ANA_{os.path.basename(tempdir)[4:]}"
+        self.writeBatchCommandFile ( datasets, anadir )
+        self.linkInstallation ( tempdir )
+        subprocess.getoutput ( "mv %s %s/recast" % ( self.recastfile, tempdir ) )
+        subprocess.getoutput ( "mv %s %s/ma5cmd" % ( self.commandfile, tempdir ) )
 
-        SModelS_analysis_name = bakeryHelpers.ma5AnaNameToSModelSName ( analysis_name )
-        output_file = f"{self.weightsdir}/{SModelS_analysis_name}.{self.topo}.{self.njets}jet.MA5.json"
-        # Write the signal region information for this mass point
-        self.write_weights(masses, weights, output_file)
+        os.chdir ( tempdir )
+        cmd = "python3 %s -R -s ./ma5cmd 2>&1 | tee %s" % (self.executable, \
+                self.teefile )
+        self.exe ( cmd, maxLength=None )
+        self.unlink ( self.teefile )
 
-        if errFree and not self.keep and os.path.exists ( tempdir ):
+        safdir = f"{tempdir}/{anadir}/Output/SAF"
+        summary = self.splitSummary ( f"{safdir}/CLs_output_summary.dat" )
+        allErrFree = True
+        for dsname, masses in datasets.items():
+            dsdir = f"{safdir}/{dsname}"
+            origsaffile = f"{dsdir}/{dsname}.saf"
+            origdatfile = f"{dsdir}/CLs_output_summary.dat"
+            if self.effsOnly:
+                self.writeEffsSummary ( dsdir, origdatfile, "defaultset" )
+            elif dsname in summary:
+                with open ( origdatfile, "wt" ) as f:
+                    f.writelines ( summary[dsname] )
+                    f.close()
+            errFree = True
+            if not os.path.exists ( origdatfile ):
+                errFree = False
+                self.error ( "%sno summary for %s%s" % ( spid, dsname, str(masses) ) )
+            if not os.path.exists ( origsaffile ):
+                errFree = False
+                self.error ( "saf file %s does not exist!" % origsaffile )
+            saf_files = self.safFilesOf ( origdatfile, dsdir )
+            destsaffile = bakeryHelpers.safFile ( self.ma5results, self.topo, masses, self.sqrts )
+            destdatfile = bakeryHelpers.datFile ( self.ma5results, self.topo, masses, self.sqrts )
+            if not errFree:
+                allErrFree = False
+                self.record ( masses, "failed" )
+                continue
+            shutil.move ( origdatfile, destdatfile )
+            shutil.move ( origsaffile, destsaffile )
+            if not self.keephepmc:
+                self.exe ( f"rm -rf {self.locker.hepmcFileName ( masses )}" )
+            self.writeWeightsOf ( masses, saf_files )
+            self.record ( masses, "done", dat=destdatfile, saf=destsaffile )
+
+        if allErrFree and not self.keep:
             self.exe ( f"rm -rf {tempdir}" )
-        if False and not errFree: # skip this for now
-            ## for debugging
-            dirname = f"{self.basedir}/debug/"
-            bakeryHelpers.mkdir ( dirname )
-            self.exe ( f"mv {tempdir} {dirname}" )
         os.chdir ( self.basedir )
         return {"exit_status": 0}
 
-    def write_weights(self, mass, signal_region_data, output_file):
+    def runChunked ( self, masses, hepmcfile, nchunks, pid=None ):
+        """ recast one point event-parallel: split the hepmc file into
+        nchunks, run ma5 over the chunks concurrently, and merge the counts
+        of the cutflows and of the sample files. the CLs of the chunks cannot
+        be combined, so the summary file has the efficiencies only.
+        :param nchunks: the number of chunks, i.e. of concurrent ma5 runs
+        :returns: dictionary with the exit_status, as run
         """
-        Writes signal region information to a file with locking to ensure thread safety.
-    
-        :param mass: Mass point
-        :param signal_region_data: List of dictionaries containing signal region info
-        :param output_file: Path to the output file
+        self.checkInstallation()
+        spid = ""
+        if pid is not None:
+            spid = "[%d]" % pid
+        if self.checkForSummaryFile(masses):
+            self.record ( masses, "done" )
+            return {"exit_status": 1}
+        if not os.path.exists(hepmcfile):
+            self.error ( "%scannot find hepmc file %s" % ( spid, hepmcfile ) )
+            self.record ( masses, "failed" )
+            return {"exit_status": -1}
+        self.record ( masses, "recasting" )
+        process = "%s_%djet" % (self.topo, self.njets)
+        Dir = bakeryHelpers.dirName(process, masses)
+        workdir = tempfile.mkdtemp ( prefix=f"ma5_{Dir}.chunks", dir=self.basedir )
+        chunks = bakeryHelpers.splitHepmc ( hepmcfile, nchunks, workdir )
+        self.msg ( "%s split %s into %d chunks" % ( spid, hepmcfile, len(chunks) ) )
+        self.writeRecastingCard()
+        chunkdirs = []
+        for i,chunk in enumerate ( chunks ):
+            chunkdir = f"{workdir}/chunk{i}.d"
+            os.mkdir ( chunkdir )
+            self.linkInstallation ( chunkdir )
+            shutil.copy ( self.recastfile, f"{chunkdir}/recast" )
+            self.commandfile = f"{chunkdir}/ma5cmd"
+            self.writeCommandFile ( chunk, process, masses )
+            chunkdirs.append ( chunkdir )
+        self.unlink ( self.recastfile )
+
+        from concurrent.futures import ThreadPoolExecutor
+        cmd = "python3 %s -R -s ./ma5cmd 2>&1" % self.executable
+        with ThreadPoolExecutor ( max_workers = len(chunkdirs) ) as pool:
+            list ( pool.map ( lambda d: self.exe ( cmd, maxLength=None, cwd=d ),
+                              chunkdirs ) )
+
+        cutflows = {}
+        for chunkdir in chunkdirs:
+            safdir = f"{chunkdir}/ANA_{Dir}/Output/SAF/defaultset"
+            for ananame, records in self.cutflowsOf ( safdir ).items():
+                if not ananame in cutflows:
+                    cutflows[ananame] = []
+                cutflows[ananame] += records
+        cutflows = { a: ma5Helpers.mergeCutflows ( r ) for a,r in cutflows.items() }
+        saffiles = [ f"{d}/ANA_{Dir}/Output/SAF/defaultset/defaultset.saf" for d in chunkdirs ]
+        errFree = len(cutflows) > 0 and all ( [ os.path.exists ( s ) for s in saffiles ] )
+        destdatfile = bakeryHelpers.datFile ( self.ma5results, self.topo, masses, self.sqrts )
+        destsaffile = bakeryHelpers.safFile ( self.ma5results, self.topo, masses, self.sqrts )
+        if errFree:
+            ## with the event count of all chunks, see emCreator.getNEvents
+            errFree = ma5Helpers.mergeSampleInfos ( saffiles, destsaffile )
+        if errFree:
+            self.writeEffs ( cutflows, destdatfile )
+            errFree = os.path.exists ( destdatfile )
+        if errFree:
+            store = weightsStore.WeightsStore ( self.weightsdir )
+            for ananame, records in cutflows.items():
+                store.put ( bakeryHelpers.ma5AnaNameToSModelSName ( ananame ),
+                    self.topo, self.njets, masses,
+                    [ ma5Helpers.weightRecord ( c ) for c in records ] )
+            if not self.keephepmc:
+                self.exe ( f"rm -rf {hepmcfile}" )
+        else:
+            self.error ( "%s the chunks of %s did not all produce cutflows" % ( spid, str(masses) ) )
+        if not self.keep:
+            self.exe ( f"rm -rf {workdir}" )
+        if errFree:
+            self.record ( masses, "done", dat=destdatfile, saf=destsaffile )
+        else:
+            self.record ( masses, "failed" )
+        return {"exit_status": 0}
+
+    def splitSummary ( self, summaryfile ):
+        """ split the CLs summary of a batch session by dataset. the dataset
+        column is renamed to defaultset, as in the summaries of single points.
+        :returns: dictionary of dataset name -> lines, with the header
+        """
+        ret, header = {}, []
+        if not os.path.exists ( summaryfile ):
+            return ret
+        with open ( summaryfile, "rt" ) as f:
+            lines = f.readlines()
+            f.close()
+        for line in lines:
+            tokens = line.split()
+            if line.startswith("#") or len(tokens) == 0:
+                header.append ( line )
+                continue
+            if not tokens[0] in ret:
+                ret[tokens[0]] = list ( header )
+            ret[tokens[0]].append ( line.replace ( tokens[0], "defaultset", 1 ) )
+        return ret
+
+    def record ( self, masses, state, **artifacts ):
+        """ record the state of the point in the campaign journal """
+        self.journal.setState ( self.topo, masses, self.sqrts, self.analyses,
+                                "ma5", state, **artifacts )
+
+    def isMutable ( self, reldir, filename ):
+        """ is this a file in tools/ that ma5 rewrites when running
+        the PAD, and that thus needs a private copy?
+        :param reldir: the directory of the file, relative to tools/
+        """
+        parts = reldir.split ( os.sep )
+        if not parts[0].startswith ( "PAD" ):
+            return False
+        if parts[1:3] == [ "Build", "Main" ]:
+            return True
+        return filename in [ "analysisList.h", "setup.sh", "setup.csh" ]
+
+    def isLimitInfo ( self, reldir, filename ):
+        """ is this the .info file of a PAD analysis, with the data that
+        ma5 needs for the CLs computation? ma5 skips the CLs of
+        analyses without it. """
+        parts = reldir.split ( os.sep )
+        return parts[0].startswith ( "PAD" ) and filename.endswith ( ".info" ) \
+               and parts[-1] == "Analyzer"
+
+    def linkInstallation ( self, tempdir ):
+        """ turn tempdir into a light-weight clone of the ma5 installation.
+        bin/ is copied, so ma5 takes tempdir as its home, madanalysis/ is
+        linked. tools/ is rebuilt as real directories with links to the
+        installed files, except for the few files that ma5 rewrites
+        when running the PAD, which are copied. the PAD Output directories
+        start out empty. the compiler and linker replace links to object
+        files and libraries, rather than writing through them.
+        this saves the copy of the installation only: the bin/ma5 front-end
+        still rewrites the main of the PAD, and builds and links the job,
+        for every point.
         """
-        with open(output_file, 'a') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)  # Lock the file to prevent race conditions
-
-            # Determine if the total number of events, sum of weights, and sum of weights squared are identical across all SRs
-            all_total_nevents = [entry['__nevents__'] for entry in signal_region_data]
-            all_total_weights = [entry['total_sum_weights'] for entry in signal_region_data]
-            all_total_weights_squared = [entry['total_sum_weights_squared'] for entry in signal_region_data]
-
-            unique_nevents = set(all_total_nevents)
-            unique_total_weights = set(all_total_weights)
-            unique_total_weights_squared = set(all_total_weights_squared)
-
-            if len(unique_nevents) > 1 or len(unique_total_weights) > 1 or len(unique_total_weights_squared) > 1:
-                raise ValueError("Mismatch in the initial number of events or the initial sum of weights or squared weights across signal regions. Please check the MadAnalysis5 output.")
-
-            total_nevents_common = unique_nevents.pop()
-            total_sum_weights_common = unique_total_weights.pop()
-            total_sum_weights_squared_common = unique_total_weights_squared.pop()
-
-            # Construct the mass-specific dictionary
-            mass_entry = {
-                str(mass): {
-                    entry['SR']: {
-                        'nevents': entry['final_nevents'],
-                        'Sum_of_Weights': entry['final_sum_weights'],
-                        'Sum_of_Weights_Squared': entry['final_sum_weights_squared']
-                    }
-                    for entry in signal_region_data
-                }
-            }
-
-            # Add common values at the top level
-            mass_entry[str(mass)]['Common'] = {
-                '__total_nevents__' : total_nevents_common,
-                '__Total_Sum_of_Weights__': total_sum_weights_common,
-                '__Total_Sum_of_Weights_Squared__': total_sum_weights_squared_common
-            }
-
-            # Serialize the dictionary to a JSON-like string with sorted keys for consistent formatting
-            formatted_entry = json.dumps(mass_entry, indent=None, separators=(',', ': '))
-
-            # Write the formatted entry followed by a newline
-            f.write(formatted_entry + '\n')
-
-            fcntl.flock(f, fcntl.LOCK_UN)  # Unlock the file
+        install = os.path.abspath ( self.ma5install )
+        subprocess.getoutput ( f"cp -r {install}/bin {tempdir}" )
+        os.symlink ( f"{install}/madanalysis", f"{tempdir}/madanalysis" )
+        tools = f"{install}/tools"
+        for root, dirs, files in os.walk ( tools ):
+            reldir = os.path.relpath ( root, tools )
+            dest = os.path.normpath ( os.path.join ( tempdir, "tools", reldir ) )
+            os.makedirs ( dest, exist_ok=True )
+            parts = reldir.split ( os.sep )
+            if parts[0].startswith ( "PAD" ) and parts[1:2] == [ "Output" ]:
+                dirs[:] = []
+                continue
+            for d in [ d for d in dirs if os.path.islink ( os.path.join ( root, d ) ) ]:
+                os.symlink ( os.path.join ( root, d ), os.path.join ( dest, d ) )
+                dirs.remove ( d )
+            for f in files:
+                if self.effsOnly and self.isLimitInfo ( reldir, f ):
+                    continue
+                if self.isMutable ( reldir, f ):
+                    shutil.copy2 ( os.path.join ( root, f ), os.path.join ( dest, f ) )
+                else:
+                    os.symlink ( os.path.join ( root, f ), os.path.join ( dest, f ) )
 
-    def extract(self, masses, saf_files):
-        """Extract efficiencies and SAF file weight information from MA5."""
-        print("Entered extract function")
-        print(f"Received masses: {masses}")
-        print(f"SAF files provided: {saf_files}")
+    def cutflowsOf ( self, safdir ):
+        """ the cutflows of all analyses of a dataset
+        :param safdir: the dataset directory, e.g. .../Output/SAF/defaultset
+        :returns: dictionary of analysis -> list of cutflow records
+        """
+        ret = {}
+        for cutflowdir in sorted ( glob.glob ( f"{safdir}/*/Cutflows" ) ):
+            ananame = os.path.basename ( os.path.dirname ( cutflowdir ) )
+            saffiles = sorted ( glob.glob ( f"{cutflowdir}/*.saf" ) )
+            ret[ananame] = ma5Helpers.readCutflows ( saffiles )
+        return ret
+
+    def writeEffsSummary ( self, safdir, summaryfile, dataset=None ):
+        """ write a summary file with only the efficiencies, computed from
+        the cutflows, in lines of "dataset analysis region eff statunc".
+        :param safdir: the dataset directory, e.g. .../Output/SAF/defaultset
+        :param dataset: the name in the dataset column, if None, then the
+                        name of safdir
+        """
+        if dataset == None:
+            dataset = os.path.basename ( safdir )
+        self.writeEffs ( self.cutflowsOf ( safdir ), summaryfile, dataset )
+
+    def writeEffs ( self, cutflows, summaryfile, dataset="defaultset" ):
+        """ write the efficiencies of cutflows to a summary file
+        :param cutflows: dictionary of analysis -> list of cutflow records
+        """
+        lines = []
+        for ananame, records in cutflows.items():
+            for cutflow in records:
+                if cutflow.sumw == 0.:
+                    continue
+                eff = cutflow.final_sumw / cutflow.sumw
+                statunc = cutflow.final_sumw2**.5 / cutflow.sumw
+                lines.append ( f"{dataset} {ananame} {cutflow.region} {eff:.6g} {statunc:.6g}\n" )
+        if len(lines) == 0:
+            self.error ( f"found no cutflows for {summaryfile}" )
+            return
+        with open ( summaryfile, "wt" ) as f:
+            f.write ( "# dataset analysis signal_region efficiency stat_unc (efficiencies only, no CLs)\n" )
+            f.writelines ( lines )
+            f.close()
+        self.msg ( f"wrote efficiencies of {len(lines)} regions to {summaryfile}" )
 
+    def extract(self, masses, saf_files):
+        """Extract efficiencies and SAF file weight information from MA5.
+        :returns: efficiencies, list of the weights per signal region,
+                  and the timestamp of the summary file
+        """
         if not saf_files:
             print("No SAF files to process")
             return {}, [], 0.0
 
-        topo = self.topo
-        njets = self.njets
-        process = f"{topo}_{njets}jet"
-        summaryfile = bakeryHelpers.datFile(self.ma5results, topo, masses, self.sqrts)
-
-        print(f"Checking summary file: {summaryfile}")
+        summaryfile = bakeryHelpers.datFile(self.ma5results, self.topo, masses, self.sqrts)
         if not os.path.exists(summaryfile):
             print(f"Summary file {summaryfile} does not exist")
             return {}, [], 0.0
 
         timestamp = os.stat(summaryfile).st_mtime
-        with open(summaryfile, "r") as f:
-            lines = f.readlines()
-
-        print(f"Summary file contains {len(lines)} lines")
-        effs = {}
-        for line in lines:
-            if "#" in line:
-                line = line.split("#")[0].strip()
-            if not line:
-                continue
-            tokens = line.split()
-            #print(f"Processing line: {tokens}")
-
-            if len(tokens) == 10:
-                dsname, ananame, sr, sig95exp, sig95obs, pp, eff, statunc, systunc, totunc = tokens
-            elif len(tokens) == 8:
-                dsname, ananame, sr, sig95exp, sig95obs, pp, eff, statunc = tokens
-            elif len(tokens) == 7:
-                dsname, ananame, sr, sig95exp, pp, eff, statunc = tokens
-            else:
-                print(f"Cannot parse line: {tokens}")
-                continue
-
-            eff = float(eff)
-            if ananame not in effs:
-                effs[ananame] = {}
-            effs[ananame][sr] = eff
-            print(f"Updated effs: {effs}")
-
-        saf_weights = []
-        for saf_file in saf_files:
-            print(f"Processing SAF file: {saf_file}")
-            if not os.path.exists(saf_file):
-                print(f"SAF file {saf_file} does not exist!")
-                continue
-
-            with open(saf_file, "r") as f:
-                lines = f.readlines()
-
-            print(f"SAF file {saf_file} contains {len(lines)} lines")
-            initial_weights, last_weights = None, None
-
-            for i, line in enumerate(lines):
-                if line.startswith('"Initial number of events"'):
-                    try:
-                        initial_weights = (
-                            float(lines[i + 1].split()[0]), # the intial number of events
-                            float(lines[i + 2].split()[0]), # Total sum of weights
-                            float(lines[i + 3].split()[0]), # Total sum of weights squared
-                        )
-                        #print(f"Extracted initial nb of events and weights from {saf_file}: {initial_weights}")
-                    except (IndexError, ValueError) as e:
-                        print(f"Error extracting initial weights from {saf_file}: {e}")
-                elif "<Counter>" in line and not "</Counter>" in line:
-                    try:
-                        last_weights = (
-                            float(lines[i + 2].split()[0]),
-                            float(lines[i + 3].split()[0]),
-                            float(lines[i + 4].split()[0]),
-                        )
-                        #print(f"Extracted last weights from {saf_file}: {last_weights}")
-                    except (IndexError, ValueError) as e:
-                        print(f"Error extracting last weights from {saf_file}: {e}")
-
-            if initial_weights and last_weights:
-                SR_name = os.path.splitext(os.path.basename(saf_file))[0]
-                saf_weights.append(
-                    {
-                        "SR": SR_name,
-                        "__nevents__": initial_weights[0],
-                        "total_sum_weights": initial_weights[1],
-                        "total_sum_weights_squared": initial_weights[2],
-                        "final_nevents": last_weights[0],
-                        "final_sum_weights": last_weights[1],
-                        "final_sum_weights_squared": last_weights[2],
-                    }
-                )
-                #print(f"Added weights for {saf_file}: {saf_weights[-1]}")
-            else:
-                print(f"No weights extracted from {saf_file}")
-
-        print(f"Final efficiencies: {effs}")
-        print(f"Final SAF weights: {saf_weights}")
-        print(f"Timestamp from summary file: {timestamp}")
+        effs = ma5Helpers.summaryEffs ( summaryfile )
 
+        saf_weights = [ ma5Helpers.weightRecord ( c ) for c in \
+                        ma5Helpers.readCutflows ( saf_files ) ]
+        self.msg ( f"extracted {len(saf_weights)} regions of {masses} from {summaryfile}" )
         return effs, saf_weights, timestamp
 
-    def exe ( self, cmd, maxLength=100 ):
+    def exe ( self, cmd, maxLength=100, cwd=None ):
         """ execute cmd in shell
         :param maxLength: maximum length of output to be printed
+        :param cwd: the directory to execute cmd in, None is the current one
         """
-        self.msg ( f"exec: [{os.getcwd()}] {cmd}" )
+        if cwd == None:
+            cwd = os.getcwd()
+        self.msg ( f"exec: [{cwd}] {cmd}" )
         """ for container only!
         myenv = dict(os.environ)
         # home = "/scratch-cbe/users/wolfgan.waltenberger/"
@@ -554,7 +744,7 @@ class MA5Wrapper:
                                   stderr=subprocess.PIPE )
         """
         pipe = subprocess.Popen ( cmd, shell=True, stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE )
+                                  stderr=subprocess.PIPE, cwd=cwd )
         ret=""
         for line in io.TextIOWrapper(pipe.stdout, encoding="latin1"):
             ret+=line
@@ -606,6 +796,8 @@ if __name__ == "__main__":
                              type=int, default=1 )
     argparser.add_argument ( '-r', '--rerun', help='force rerun, even if there is a summary file already',
                              action="store_true" )
+    argparser.add_argument ( '-b', '--batch', help='run all points of a process in one ma5 session, one dataset per point',
+                             action="store_true" )
     args = argparser.parse_args()
     if args.list_analyses:
         ma5 = MA5Wrapper( args.topo, args.njets, args.rerun, args.analyses )
@@ -635,6 +827,11 @@ if __name__ == "__main__":
     djobs = int(len(masses)/nprocesses)
 
     def runChunk ( chunk, pid ):
+        if args.batch:
+            todo = [ c for c in chunk if ma5.locker.hasHEPMC ( c ) and \
+                     not ma5.locker.isLocked ( c ) ]
+            ma5.runBatch ( todo, pid )
+            return
         for c in chunk:
             hashepmc = ma5.locker.hasHEPMC ( c )
             hepmcfile = ma5.locker.hepmcFileName ( c )
@@ -10,10 +10,13 @@
 
 import os, sys, colorama, subprocess, shutil, tempfile, time, socket, random, ast
 from colorama import Fore as ansi
-import multiprocessing, glob, io
+import multiprocessing, glob, io, threading, gzip
 import bakeryHelpers
 from bakeryHelpers import rmLocksOlderThan
 import locker
+import journal
+import hepmcIndex
+import hepmcStream
 from typing import Dict, List
 
 class MG5Wrapper:
@@ -35,11 +38,21 @@ class MG5Wrapper:
         self.mkdir ( self.resultsdir )
         self.locker = locker.Locker ( args["sqrts"], args["topo"],
                                       args["ignore_locks"] )
+        self.journal = journal.Journal ( self.basedir )
         self.topo = args["topo"]
         self.keep = args["keep"]
         self.keephepmc = args["keephepmc"]
         self.rerun = args["rerun"]
         self.njets = args["njets"]
+        self.procdirCache = not args["no_procdir_cache"]
+        self.gridpack = args["gridpack"]
+        self.ma5EffsOnly = args["ma5_effs_only"]
+        self.recastChunks = args["recast_chunks"]
+        self.hepmcFifo = args["hepmc_fifo"]
+        self.hepmcFanout = args["hepmc_fanout"]
+        self.delphesCache = args["delphes_cache"]
+        self.cutlangBatch = args["cutlang_batch"]
+        self.postfilter = args["postfilter"]
         self.mg5install = os.path.join(self.basedir, "mg5")
         self.logfile = None
         self.logfile2 = None
@@ -231,6 +244,8 @@ class MG5Wrapper:
                         v = v.replace("M[0]",str(m0))
                         v = str(eval (v ))
                     line = line.replace( f"@@{k}@@",v)
+            if self.gridpack and "= gridpack" in line:
+                line = line.replace ( "False", "True" )
             g.write ( line )
         if False and self.topo in [ "TChiQ" ]:
             self.info( f"topo is {self.topo}: switch to new sde strategy (2)" )
@@ -250,7 +265,11 @@ class MG5Wrapper:
         f = open(self.commandfile,'w')
         f.write('set automatic_html_opening False\n' )
         f.write('launch %s\n' % bakeryHelpers.dirName(process,masses))
-        f.write('shower=Pythia8\n')
+        if self.gridpack:
+            ## integration only, the showering happens when running the gridpack
+            f.write('shower=OFF\n')
+        else:
+            f.write('shower=Pythia8\n')
         f.write('detector=OFF\n')
         #f.write('detector=Delphes\n')
         #f.write('pythia=ON\n')
@@ -317,7 +336,136 @@ class MG5Wrapper:
 
     def run( self, masses, analyses, pid=None ):
         """ Run MG5 for topo, with njets additional ISR jets, giving
-        also the masses as a list.
+        also the masses as a list. Then run the recasting.
+        :returns: outcome of the point, one of "done", "skipped",
+                  "locked", "failed"
+        """
+        outcome = self.generate ( masses, analyses, pid )
+        if outcome != "generated":
+            return outcome
+        return self.recastPoint ( masses, analyses, pid )
+
+    def recastPoint ( self, masses, analyses, pid=None ):
+        """ run the recasting on the hepmc file of a point that
+        has been generated (and locked) by self.generate, then free the point,
+        also if the recasting raises.
+        :returns: "done" if all recasters are done with the point, else "failed"
+        """
+        self.locker.adopt ( masses ) ## the generator may be gone before we are done
+        self.record ( masses, analyses, "recasting" )
+        state = "failed"
+        try:
+            self.runRecasting ( masses, analyses, pid )
+            state = self.recastOutcome ( masses, analyses )
+        finally:
+            self.locker.unlock ( masses )
+            self.record ( masses, analyses, state )
+        return state
+
+    def recastOutcome ( self, masses, analyses ) -> str:
+        """ the state of a point, from the states that the recasters recorded
+        in the journal: ma5 records one job for all analyses, the others one
+        per analysis.
+        :returns: "done", if all of them are done, else "failed"
+        """
+        if not self.recast:
+            return "done"
+        jobs = []
+        for recaster in self.recaster:
+            if recaster == "MA5":
+                jobs.append ( ( analyses, recaster ) )
+            else:
+                jobs += [ ( ana, recaster ) for ana in analyses.split(",") ]
+        for ana, recaster in jobs:
+            state = self.journal.getState ( self.topo, masses, self.sqrts, ana, recaster )
+            if state != "done":
+                self.error ( f"{recaster} on {ana} for {masses} ended as {state}" )
+                return "failed"
+        return "done"
+
+    def filterDone ( self, masses, analyses ):
+        """ remove the points that are already in the embaked file, in bulk,
+        before any worker starts. records them as done in the journal.
+        :returns: the points that still need to be run
+        """
+        if self.rerun:
+            return masses
+        import emCreator
+        todo = emCreator.completionIndex.filterDone ( masses, analyses,
+                self.topo, self.recaster )
+        if len(todo) < len(masses):
+            self.info ( f"{len(masses)-len(todo)} of {len(masses)} points are already in the embaked file" )
+            todoset = set ( [ tuple(m) for m in todo ] )
+            for m in masses:
+                if not tuple(m) in todoset:
+                    self.record ( m, analyses, "done" )
+        return todo
+
+    def plan ( self, masses, analyses ) -> Dict:
+        """ sort the points into complete ones (in the embaked file, or
+        with recast output), partial ones (hepmc file but no recast output),
+        and new ones.
+        :returns: dictionary with the lists of mass tuples,
+                  e.g. { "new": [ (500,100) ], "partial": [], "complete": [] }
+        """
+        import emCreator
+        ret = { "new": [], "partial": [], "complete": [] }
+        for m in masses:
+            if emCreator.completionIndex.isDone ( m, analyses, self.topo, self.recaster ):
+                ret["complete"].append ( m )
+            elif self.hasRecastOutput ( m ):
+                ret["complete"].append ( m )
+            elif self.locker.hasHEPMC ( m ):
+                ret["partial"].append ( m )
+            else:
+                ret["new"].append ( m )
+        return ret
+
+    def exportEmbaked ( self ):
+        """ write the points that the recasters logged into the .embaked
+        files, see embakedStore """
+        import embakedStore
+        store = embakedStore.EmbakedStore ( os.path.join ( self.basedir, "embaked" ) )
+        for fname in store.exportPending():
+            self.info ( f"exported the new points of {fname}" )
+
+    def hasRecastOutput ( self, masses ) -> bool:
+        """ are the output files of the recaster for masses lying around?
+        the same check for plan and generate """
+        if "adl" in self.recaster:
+            return self.locker.hasCutlangFiles ( masses )
+        return self.locker.hasMA5Files ( masses )
+
+    def writePlan ( self, plan : Dict, planfile : str, analyses : str ):
+        """ write the plan to planfile, as a dictionary """
+        with open ( planfile, "wt" ) as f:
+            f.write ( f"# plan for {self.topo}, {analyses}, {','.join(self.recaster)}, created {time.asctime()}\n" )
+            f.write ( "{\n" )
+            for k,v in plan.items():
+                f.write ( f"'{k}': {v},\n" )
+            f.write ( "}\n" )
+            f.close()
+        self.announce ( f"wrote plan to {planfile}: {len(plan['new'])} new, {len(plan['partial'])} partial, {len(plan['complete'])} complete points" )
+
+    def readPlan ( self, planfile : str ) -> List:
+        """ read a plan file, return the points that still need work:
+        the partial ones first, as they only need recasting """
+        with open ( planfile, "rt" ) as f:
+            plan = ast.literal_eval ( f.read() )
+            f.close()
+        self.info ( f"read plan {planfile}: {len(plan['new'])} new, {len(plan['partial'])} partial, {len(plan['complete'])} complete points" )
+        return plan["partial"] + plan["new"]
+
+    def record ( self, masses, analyses, state, **artifacts ):
+        """ record the state of the point in the campaign journal """
+        self.journal.setState ( self.topo, masses, self.sqrts, analyses,
+                ",".join(self.recaster), state, **artifacts )
+
+    def generate ( self, masses, analyses, pid=None ):
+        """ produce the hepmc file for the masses, but do not recast.
+        if all goes well, the point stays locked, to be unlocked by self.recastPoint.
+        :returns: "generated" if the hepmc file is ready for recasting,
+                  else one of "skipped", "locked", "failed"
         """
         os.system("echo $LD_LIBRARY_PATH")
         self.sleep()
@@ -327,25 +475,25 @@ class MG5Wrapper:
         # print ( f"is the point {masses} for {analyses} in embakedfile? {isIn} rerun: {self.rerun}" )
         # sys.exit()
         if isIn and not self.rerun:
-            return
-        if not "adl" in self.recaster and self.locker.hasMA5Files ( masses ) and not self.rerun:
-            return
-        if "adl" in self.recaster and self.locker.hasCutlangFiles ( masses ) and not self.rerun:
-            return
+            self.record ( masses, analyses, "done" )
+            return "skipped"
+        if self.hasRecastOutput ( masses ) and not self.rerun:
+            self.record ( masses, analyses, "done" )
+            return "skipped"
         locked = self.locker.lock ( masses )
         if locked:
             self.info ( "%s[%s] is locked. Skip it" % ( masses, self.topo ) )
             self.info ( f"If you wish to remove it:\nrm {self.locker.lockfile(masses)}" )
-            return
+            return "locked"
         self.process = "%s_%djet" % ( self.topo, self.njets )
+        hepmcfile = self.locker.hepmcFileName ( masses )
         if self.locker.hasHEPMC ( masses ):
             if not self.rerun:
                 which  = self.recaster[0]
                 self.info ( "hepmc file for %s[%s] exists. go directly to %s." % \
                             ( str(masses), self.topo, which ) )
-                self.runRecasting ( masses, analyses, pid )
-                self.locker.unlock ( masses )
-                return
+                self.record ( masses, analyses, "generated", hepmc=hepmcfile )
+                return "generated"
             else:
                 self.info ( "hepmc file for %s exists, but rerun requested." % str(masses) )
 
@@ -363,6 +511,7 @@ class MG5Wrapper:
             self.mgParams["XQCUT"]="M[0]/2"
        
         self.announce ( "starting MG5 on %s[%s] at %s in job #%s" % (masses, self.topo, time.asctime(), pid ) )
+        self.record ( masses, analyses, "generating" )
         slhaTemplate = f"slha/{self.topo}_template.slha"
         self.pluginMasses( slhaTemplate, masses )
         # first write pythia card
@@ -370,29 +519,142 @@ class MG5Wrapper:
         # then write command file
         self.writeCommandFile( process=self.process, masses=masses )
         # then run madgraph5
-        r=self.execute ( self.slhafile, masses )
+        if self.gridpack:
+            r=self.executeGridpack ( self.slhafile, masses )
+        else:
+            r=self.execute ( self.slhafile, masses )
         self.unlink ( self.slhafile )
-        if r:
-            self.runRecasting ( masses, analyses, pid )
-        self.locker.unlock ( masses )
+        if not r:
+            self.locker.unlock ( masses )
+            self.record ( masses, analyses, "failed" )
+            return "failed"
+        self.record ( masses, analyses, "generated", hepmc=hepmcfile )
+        return "generated"
 
     def runRecasting ( self, masses, analyses, pid ):
         """ run the recasting. cutlang or ma5 """
-        try:
-            if not self.recast:
-                return
+        if not self.recast:
+            return
+        if self.hepmcFanout: ## all but ma5 at once
+            self.runFanOut ( masses, analyses, pid )
+        else:
             if "adl" in self.recaster:
                 self.runCutlang ( masses, analyses, pid )
             if "cm2" in self.recaster:
                 self.runCheckmate ( masses, analyses, pid )
             if "colliderbit" in self.recaster:
                 self.runColliderbit ( masses, analyses, pid )
-            if "MA5" in self.recaster:
-                self.runMA5 ( masses, analyses, pid )
-        except Exception as e:
-            if self.keep: # if keep is on, we remove the lock. seems like were debugging
-                self.locker.unlock ( masses )
-            raise e
+        if "MA5" in self.recaster:
+            self.runMA5 ( masses, analyses, pid )
+
+    def cutlangWrapper ( self, ana ):
+        """ the cutlang wrapper for one analysis """
+        from cutlangWrapper import CutLangWrapper
+        return CutLangWrapper ( self.topo, self.njets, self.rerun, ana,
+                auto_confirm = True, keep = self.keep, adl_file = self.adl_file,
+                event_condition = self.event_condition, fifo = self.hepmcFifo,
+                delphes_cache = self.delphesCache,
+                prefilter = not self.postfilter, sqrts = self.sqrts )
+
+    def cutlangBatches ( self, analyses ):
+        """ the cutlang wrappers of all analyses, batched by delphes card """
+        from cutlangWrapper import batchesOf
+        wrappers = [ self.cutlangWrapper ( ana.strip() ) for ana in analyses.split(",") ]
+        return batchesOf ( wrappers )
+
+    def checkmateWrapper ( self, ana ):
+        """ the checkmate wrapper for one analysis """
+        from cm2Wrapper import CM2Wrapper
+        return CM2Wrapper ( self.topo, self.njets, self.rerun, ana, keep = self.keep,
+                            sqrts = self.sqrts )
+
+    def colliderbitWrapper ( self, ana ):
+        """ the colliderbit wrapper for one analysis """
+        from gambitWrapper import GambitWrapper
+        cl = GambitWrapper ( self.topo, self.njets, self.rerun, ana, 
+                             keep = self.keep, sqrts = self.sqrts )
+        cl.nevents = self.nevents
+        return cl
+
+    def runFanOut ( self, masses, analyses, pid ):
+        """ run cutlang, checkmate and colliderbit on all analyses of a point
+        concurrently. the delphes runs of cutlang are all fed by a single
+        decompression of the hepmc file, through pipes that they read as
+        their standard input, see hepmcStream. checkmate and colliderbit
+        share temporary files, so they run one after the other, alongside
+        cutlang, on a decompressed file of their own.
+        :raises: IOError, if the hepmc file could not be decompressed
+        """
+        spid=""
+        if pid != None:
+            spid = f" in job #{pid}"
+        streamed, serial = [], []
+        if "adl" in self.recaster and self.cutlangBatch:
+            for batch in self.cutlangBatches ( analyses ):
+                streamed.append ( ( f"adl:{batch.analysis}", batch ) )
+        for ana in analyses.split(","):
+            ana = ana.strip()
+            if "adl" in self.recaster and not self.cutlangBatch:
+                streamed.append ( ( f"adl:{ana}", self.cutlangWrapper ( ana ) ) )
+            if "cm2" in self.recaster:
+                serial.append ( ( f"cm2:{ana}", self.checkmateWrapper ( ana ) ) )
+            if "colliderbit" in self.recaster:
+                serial.append ( ( f"colliderbit:{ana}", self.colliderbitWrapper ( ana ) ) )
+        if len(streamed) + len(serial) == 0:
+            return
+        os.chdir ( self.basedir ) ## the wrappers may have moved us
+        names = ", ".join ( [ c[0] for c in streamed + serial ] )
+        self.announce ( f"starting {names} on {str(masses)}[{self.topo}] at {time.asctime()}{spid}" )
+        hepmcfile = self.locker.hepmcFileName ( masses )
+        errors = []
+        def consume ( name, cl, *args, **kwargs ):
+            try:
+                cl.run ( masses, *args, pid, **kwargs )
+            except Exception as e:
+                self.error ( f"{name} failed on {masses}: {e}" )
+        fanout = None
+        if len(streamed) > 0:
+            fanout = hepmcStream.FanOut ( hepmcfile, len(streamed) )
+        def consumeStream ( i ):
+            stream = fanout.stream ( i )
+            try:
+                consume ( *streamed[i], hepmcfile, stream = stream )
+            finally:
+                stream.release()
+        tempdir = os.path.join ( self.basedir, "temp" )
+        bakeryHelpers.mkdir ( tempdir )
+        fd, plainfile = tempfile.mkstemp ( prefix = f"fanout_{self.topo}_",
+                                           suffix = ".hepmc", dir = tempdir )
+        os.close ( fd )
+        def consumeSerially():
+            if len(serial) == 0:
+                return
+            try:
+                with gzip.open ( hepmcfile, "rb" ) as f:
+                    with open ( plainfile, "wb" ) as out:
+                        shutil.copyfileobj ( f, out, 1 << 20 )
+            except Exception as e:
+                errors.append ( f"could not decompress {hepmcfile}: {e}" )
+                return
+            for name, cl in serial:
+                consume ( name, cl, plainfile )
+        threads = [ threading.Thread ( target = consumeStream, args = ( i, ) ) \
+                    for i in range(len(streamed)) ]
+        threads.append ( threading.Thread ( target = consumeSerially ) )
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if os.path.exists ( plainfile ):
+            os.unlink ( plainfile )
+        try:
+            if fanout != None:
+                fanout.close()
+        except IOError as e:
+            errors.append ( str(e) )
+        if len(errors) > 0:
+            raise IOError ( "; ".join ( errors ) )
+        self.announce ( f"finished MG5+{names} for {str(masses)}[{self.topo}] at {time.asctime()}{spid}" )
 
     def runMA5 ( self, masses, analyses, pid ):
         """ run ma5, if desired """
@@ -402,10 +664,14 @@ class MG5Wrapper:
         self.announce ( "starting MA5 on %s[%s] at %s%s" % ( str(masses), self.topo, time.asctime(), spid ) )
         from ma5Wrapper import MA5Wrapper
         ma5 = MA5Wrapper ( self.topo, self.njets, self.rerun, analyses, self.keep,
-                           self.sqrts, keephepmc = self.keephepmc )
+                           self.sqrts, keephepmc = self.keephepmc,
+                           effsOnly = self.ma5EffsOnly )
         self.debug ( "now call ma5Wrapper" )
         hepmcfile = self.locker.hepmcFileName ( masses )
-        ma5_runs = ma5.run ( masses, hepmcfile, pid )
+        if self.recastChunks > 1:
+            ma5_runs = ma5.runChunked ( masses, hepmcfile, self.recastChunks, pid )
+        else:
+            ma5_runs = ma5.run ( masses, hepmcfile, pid )
         ret = ma5_runs["exit_status"]
 
         msg = "finished MG5+MA5"
@@ -421,16 +687,23 @@ class MG5Wrapper:
         if pid != None:
             spid = " in job #%d" % pid
         self.announce ( "starting cutlang on %s[%s] at %s%s" % ( str(masses), self.topo, time.asctime(), spid ) )
-        from cutlangWrapper import CutLangWrapper
-        rerun = self.rerun
-        # rerun = True
+        if self.cutlangBatch:
+            hepmcfile = self.locker.hepmcFileName ( masses )
+            for batch in self.cutlangBatches ( analyses ):
+                self.debug ( f"now call cutlang for {batch.analysis} in one pass" )
+                rets = batch.run ( masses, hepmcfile, pid )
+                for w, ret in zip ( batch.wrappers, rets ):
+                    msg = f"finished MG5+Cutlang[{w.analysis}]: "
+                    if ret > 0:
+                        msg += "nothing needed to be done"
+                    if ret < 0:
+                        msg += "error encountered"
+                    self.announce ( "%s for %s[%s] at %s%s" % ( msg, str(masses), self.topo, time.asctime(), spid ) )
+            return
         analist = analyses.split(",")
         for ana in analist:
             ana = ana.strip()
-            cl = CutLangWrapper ( self.topo, self.njets, rerun, ana,
-                    auto_confirm = True, keep = self.keep, adl_file = self.adl_file,
-                    event_condition = self.event_condition )
-            #                   self.sqrts )
+            cl = self.cutlangWrapper ( ana )
             self.debug ( f"now call cutlangWrapper for {ana}" )
             hepmcfile = self.locker.hepmcFileName ( masses )
             ret = cl.run ( masses, hepmcfile, pid )
@@ -447,14 +720,10 @@ class MG5Wrapper:
         if pid != None:
             spid = " in job #%d" % pid
         self.announce ( "starting checkmate on %s[%s] at %s%s" % ( str(masses), self.topo, time.asctime(), spid ) )
-        from cm2Wrapper import CM2Wrapper
-        rerun = self.rerun
-        # rerun = True
         analist = analyses.split(",")
         for ana in analist:
             ana = ana.strip()
-            cl = CM2Wrapper ( self.topo, self.njets, rerun, ana, keep = self.keep )
-            #                   self.sqrts )
+            cl = self.checkmateWrapper ( ana )
             self.debug ( f"now call cutlangWrapper for {ana}" )
             hepmcfile = self.locker.hepmcFileName ( masses )
             ret = cl.run ( masses, hepmcfile, pid )
@@ -471,15 +740,10 @@ class MG5Wrapper:
         if pid != None:
             spid = f" in job #{pid}"
         self.announce ( f"starting colliderbit on {str(masses)}[{self.topo}] at {time.asctime()}{spid}" )
-        from gambitWrapper import GambitWrapper
-        rerun = self.rerun
-        # rerun = True
         analist = analyses.split(",")
         for ana in analist:
             ana = ana.strip()
-            cl = GambitWrapper ( self.topo, self.njets, rerun, ana, 
-                                 keep = self.keep )
-            cl.nevents = self.nevents
+            cl = self.colliderbitWrapper ( ana )
             self.debug ( f"now call gambitWrapper for {ana}" )
             hepmcfile = self.locker.hepmcFileName ( masses )
             ret = cl.run ( masses, hepmcfile, pid )
@@ -599,7 +863,12 @@ class MG5Wrapper:
                 raise Exception ( f"pythia8 has no lhapdf6 support" )
         return True
 
-    def execute ( self, slhaFile, masses ):
+    def execute ( self, slhaFile, masses, gridpack = None ):
+        """ run mg5 for the masses.
+        :param gridpack: if given, only integrate, and store the gridpack
+                         under this file name
+        :returns: True, if all went well
+        """
         templatefile = self.templateDir + '/MG5_Process_Cards/'+self.topo+'.txt'
         if not os.path.isfile( templatefile ):
             self.error ( "The process card %s does not exist." % templatefile )
@@ -633,11 +902,9 @@ class MG5Wrapper:
         for i in [ 1, 2, 3 ]:
             if self.njets >= i:
                 self.addJet ( lines, i, f )
+        f.close()
 
         Dir = bakeryHelpers.dirName ( self.process, masses )
-        f.write ( "output %s\n" % Dir )
-        f.close()
-        self.info ( "run mg5 for %s[%s]: %s" % ( masses, self.topo, self.tempf ) )
         self.logfile = tempfile.mktemp ()
         if os.path.exists ( Dir ):
             subprocess.getoutput ( f"rm -rf {Dir}" )
@@ -649,10 +916,16 @@ class MG5Wrapper:
         if self.keep:
             self.mkdir ( "keep/" )
             shutil.copy ( self.tempf, "keep/" + Dir + "mg5proc" )
-        shutil.move ( self.tempf, Dir + "/mg5proc" )
-        cmd = "python%d %s %s/mg5proc 2>&1 | tee %s" % \
-              ( self.pyver, self.executable, Dir, self.logfile )
-        self.exe ( cmd, masses )
+        cacheDir = None
+        if self.procdirCache:
+            cacheDir = self.cachedProcDir ( masses )
+        if cacheDir != None:
+            self.info ( f"clone process directory {cacheDir} for {masses}[{self.topo}]" )
+            self.unlink ( self.tempf )
+            cmd = f"cp -a --reflink=auto {cacheDir}/. {Dir}/"
+            self.exe ( cmd, masses )
+        else:
+            self.runOutput ( self.tempf, Dir, masses )
         ## copy slha file
         if not os.path.exists ( Dir+"/Cards" ):
             cmd = f"rm -rf {Dir}"
@@ -676,16 +949,175 @@ class MG5Wrapper:
         self.logfile2 = tempfile.mktemp ()
         cmd = f"python{self.pyver} {self.executable} {Dir}/mg5cmd 2>&1 | tee {self.logfile2}"
         self.exe ( cmd, masses )
+        if gridpack != None:
+            origgridpack = f"{Dir}/run_01_gridpack.tar.gz"
+            if os.path.exists ( origgridpack ):
+                self.mkdir ( os.path.dirname ( gridpack ) )
+                ## move in two steps, so no one sees a partial gridpack
+                tmpfile = f"{gridpack}.{os.getpid()}"
+                shutil.move ( origgridpack, tmpfile )
+                os.rename ( tmpfile, gridpack )
+                self.info ( f"stored gridpack {gridpack}" )
+            else:
+                self.error ( f"could not find gridpack {origgridpack}!" )
+            self.clean( Dir )
+            return os.path.exists ( gridpack )
         hepmcfile = self.orighepmcFileName( masses )
         if self.hasorigHEPMC ( masses ):
             dest = self.locker.hepmcFileName ( masses )
             self.msg ( "moving", hepmcfile, "to", dest )
             shutil.move ( hepmcfile, dest )
+            self.indexHepmc ( dest )
         else:
             self.error ( f"could not find orig hepmc file {self.orighepmcFileName( masses )}! maybe there is something wrong with the mg5 installation?" )
         self.clean( Dir )
         return True
 
+    def indexHepmc ( self, hepmcfile ):
+        """ write the index of a hepmc file that just landed in mg5results/,
+        see hepmcIndex """
+        try:
+            nevents = hepmcIndex.build ( hepmcfile )["nevents"]
+        except ( OSError, EOFError ) as e:
+            self.error ( f"could not index {hepmcfile}: {e}" )
+            return
+        if nevents < bakeryHelpers.constants["minimumNrOfEvents"]:
+            self.error ( f"{hepmcfile} has only {nevents} events" )
+
+    def gridpackFileName ( self, slhaFile, masses ) -> str:
+        """ the file name of the gridpack for masses. the key is a hash of
+        the process card, the param card, the run card, and the mg5 version.
+        the number of events and the seed do not enter.
+        """
+        import hashlib
+        h = hashlib.sha1()
+        templatefile = self.templateDir + '/MG5_Process_Cards/'+self.topo+'.txt'
+        for fname in [ templatefile, slhaFile ]:
+            with open ( fname, "rb" ) as f:
+                h.update ( f.read() )
+                f.close()
+        with open ( self.runcard, "rt" ) as f:
+            for line in f.readlines():
+                if "= nevents" in line or "= iseed" in line or "= gridpack" in line:
+                    continue
+                h.update ( line.encode() )
+            f.close()
+        h.update ( f"njets={self.njets};mg5={self.ver}".encode() )
+        smasses = "_".join(map(str,masses))
+        return os.path.join ( self.resultsdir, "gridpacks",
+                f"{self.process}.{smasses}.{h.hexdigest()[:12]}.tar.gz" )
+
+    def executeGridpack ( self, slhaFile, masses ):
+        """ produce the hepmc file for masses from a gridpack.
+        integrate first, if we do not yet have a gridpack.
+        :returns: True, if all went well
+        """
+        gridpack = self.gridpackFileName ( slhaFile, masses )
+        if os.path.exists ( gridpack ):
+            self.info ( f"found gridpack {gridpack} for {masses}[{self.topo}]" )
+            self.unlink ( self.runcard )
+            self.unlink ( self.commandfile )
+        else:
+            self.info ( f"no gridpack for {masses}[{self.topo}] yet, integrating" )
+            if not self.execute ( slhaFile, masses, gridpack=gridpack ):
+                return False
+        return self.runGridpack ( gridpack, masses )
+
+    def runGridpack ( self, gridpack, masses ):
+        """ generate self.nevents events from the gridpack, with a fresh seed,
+        then shower them with pythia8.
+        :returns: True, if all went well
+        """
+        seed = random.randint ( 1, 30000 )
+        workdir = tempfile.mkdtemp ( prefix="gridpack", dir=self.tempdir )
+        self.info ( f"running gridpack for {masses}[{self.topo}] with seed {seed} in {workdir}" )
+        self.exe ( f"tar xzf {gridpack} -C {workdir}", masses )
+        self.exe ( f"cd {workdir}; ./run.sh {self.nevents} {seed}", masses )
+        lhefile = f"{workdir}/events.lhe.gz"
+        if not os.path.exists ( lhefile ):
+            self.error ( f"gridpack {gridpack} did not produce {lhefile}" )
+            subprocess.getoutput ( f"rm -rf {workdir}" )
+            return False
+        evdir = f"{workdir}/madevent/Events/run_01"
+        os.makedirs ( evdir, exist_ok=True )
+        shutil.move ( lhefile, f"{evdir}/unweighted_events.lhe.gz" )
+        with open ( f"{workdir}/showercmd", "wt" ) as f:
+            f.write ( "pythia8 run_01 -f\n" )
+            f.close()
+        cmd = f"python{self.pyver} {workdir}/madevent/bin/madevent {workdir}/showercmd"
+        self.exe ( cmd, masses )
+        hepmcfile = f"{evdir}/tag_1_pythia8_events.hepmc.gz"
+        ret = os.path.exists ( hepmcfile )
+        if ret:
+            dest = self.locker.hepmcFileName ( masses )
+            self.msg ( "moving", hepmcfile, "to", dest )
+            shutil.move ( hepmcfile, dest )
+            self.indexHepmc ( dest )
+        else:
+            self.error ( f"could not find showered events {hepmcfile}!" )
+        if not self.keep:
+            subprocess.getoutput ( f"rm -rf {workdir}" )
+        return ret
+
+    def runOutput ( self, procfile, Dir, masses ):
+        """ run mg5 on the process card, with "output Dir" appended.
+        the process card ends up in Dir/mg5proc.
+
+        :param procfile: the process card, without the output line
+        :param Dir: the (existing) directory to output to
+        """
+        with open ( procfile, "at" ) as f:
+            f.write ( "output %s\n" % Dir )
+            f.close()
+        self.info ( "run mg5 for %s[%s]: %s" % ( masses, self.topo, procfile ) )
+        shutil.move ( procfile, Dir + "/mg5proc" )
+        cmd = "python%d %s %s/mg5proc 2>&1 | tee %s" % \
+              ( self.pyver, self.executable, Dir, self.logfile )
+        self.exe ( cmd, masses )
+
+    def procDirCacheName ( self ) -> str:
+        """ the name of the cached process directory for self.tempf.
+        the key is a hash of the process card, njets, and the mg5 version,
+        as the masses only enter via the param_card.dat.
+        """
+        import hashlib
+        h = hashlib.sha1()
+        with open ( self.tempf, "rb" ) as f:
+            h.update ( f.read() )
+            f.close()
+        h.update ( f"njets={self.njets};mg5={self.ver}".encode() )
+        return os.path.join ( self.basedir, "mg5cache",
+                              f"{self.process}_{h.hexdigest()[:12]}" )
+
+    def cachedProcDir ( self, masses ):
+        """ get the process directory for self.tempf from the cache.
+        if it is not yet cached, run mg5 once, and put the result into the cache.
+        concurrent jobs may all build it, the first one to finish wins.
+
+        :returns: path to the cached directory, None if it could not be created
+        """
+        cacheDir = self.procDirCacheName ()
+        if os.path.exists ( f"{cacheDir}/Cards" ):
+            return cacheDir
+        self.mkdir ( os.path.dirname ( cacheDir ) )
+        buildDir = tempfile.mkdtemp ( prefix = os.path.basename(cacheDir)+".",
+                                      dir = os.path.dirname ( cacheDir ) )
+        shutil.copy ( self.tempf, f"{buildDir}.mg5proc" )
+        self.runOutput ( f"{buildDir}.mg5proc", buildDir, masses )
+        if not os.path.exists ( f"{buildDir}/Cards" ):
+            self.error ( f"could not create process directory {buildDir} for cache" )
+            subprocess.getoutput ( f"rm -rf {buildDir}" )
+            return None
+        try:
+            os.rename ( buildDir, cacheDir )
+            self.info ( f"cached process directory {cacheDir}" )
+        except OSError as e:
+            ## someone else was faster
+            subprocess.getoutput ( f"rm -rf {buildDir}" )
+        if not os.path.exists ( f"{cacheDir}/Cards" ):
+            return None
+        return cacheDir
+
     def clean ( self, Dir=None ):
         """ clean up temporary files
         :param Dir: if given, then assume its the runtime directory, and remove "Source", "lib", "SubProcesses" and other subdirs
@@ -720,6 +1152,207 @@ class MG5Wrapper:
             return False
         return True
 
+def feedQueue ( todo, item, jobs : List ) -> bool:
+    """ put item into the bounded queue todo. blocks while the workers are
+    busy, but gives up if they have all died, e.g. by sys.exit.
+    :returns: False, if the item could not be queued
+    """
+    import queue
+    while any ( [ p.is_alive() for p in jobs ] ):
+        try:
+            todo.put ( item, timeout = 10 )
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def runQueue ( mg5 : MG5Wrapper, masses : List, analyses : str,
+               nprocesses : int, prefetch : int = 2 ) -> Dict:
+    """ run the mass points through a shared work queue. every worker
+    pulls one point at a time, so a slow point occupies only its own
+    worker, and the wall clock time is bounded by the total work.
+
+    :param mg5: the MG5Wrapper that runs a single point
+    :param masses: list of mass tuples
+    :param analyses: analyses, comma separated
+    :param nprocesses: number of workers
+    :param prefetch: number of points that are queued per worker ahead of time
+    :returns: dictionary of outcome -> list of mass tuples,
+              e.g. { "done": [ (500,100) ], "skipped": [], ... }
+    """
+    todo = multiprocessing.Queue ( maxsize = max ( 1, prefetch ) * nprocesses )
+    results = multiprocessing.Queue()
+
+    def worker ( pid ):
+        while True:
+            point = todo.get()
+            if point is None:
+                break
+            try:
+                outcome = mg5.run ( point, analyses, pid )
+            except Exception as e:
+                mg5.error ( f"{point}[{mg5.topo}] failed in job #{pid}: {e}" )
+                mg5.record ( point, analyses, "failed" )
+                outcome = "failed"
+            if outcome is None:
+                outcome = "done"
+            results.put ( ( point, outcome ) )
+        print ( "%s[runQueue] worker #%d finished%s" % \
+                ( ansi.GREEN, pid, ansi.RESET ) )
+
+    jobs=[]
+    for i in range(nprocesses):
+        p = multiprocessing.Process(target=worker, args=(i,))
+        jobs.append ( p )
+        p.start()
+    for point in list(masses) + [ None ] * nprocesses:
+        if not feedQueue ( todo, point, jobs ):
+            mg5.error ( "all workers are gone, stop feeding them" )
+            break
+    return collectOutcomes ( mg5, results, jobs, len(masses) )
+
+def runPipeline ( mg5 : MG5Wrapper, masses : List, analyses : str,
+                  genWorkers : int, recastWorkers : int,
+                  prefetch : int = 2 ) -> Dict:
+    """ run the mass points in two stages: a pool of generator workers
+    that only produce the hepmc files, and a pool of recasting workers
+    that recast them as they appear. the stages are linked by a bounded
+    hand-off queue, so the generators wait if the recasters fall behind.
+
+    :param genWorkers: number of workers that run MG5
+    :param recastWorkers: number of workers that run the recasting
+    :param prefetch: number of points queued per worker, in both queues
+    :returns: dictionary of outcome -> list of mass tuples
+    """
+    prefetch = max ( 1, prefetch )
+    todo = multiprocessing.Queue ( maxsize = prefetch * genWorkers )
+    handoff = multiprocessing.Queue ( maxsize = prefetch * recastWorkers )
+    results = multiprocessing.Queue()
+    recastersGone = multiprocessing.Event()
+
+    def handOff ( point ) -> bool:
+        """ put point into the hand-off queue. blocks while the recasters
+        are busy, gives up if they are all gone. """
+        import queue
+        while not recastersGone.is_set():
+            try:
+                handoff.put ( point, timeout = 10 )
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def generator ( pid ):
+        while True:
+            point = todo.get()
+            if point is None:
+                break
+            try:
+                outcome = mg5.generate ( point, analyses, pid )
+            except Exception as e:
+                mg5.error ( f"generating {point}[{mg5.topo}] failed in job #{pid}: {e}" )
+                mg5.locker.unlock ( point )
+                mg5.record ( point, analyses, "failed" )
+                outcome = "failed"
+            if outcome == "generated":
+                mg5.locker.handOver ( point )
+                if handOff ( point ):
+                    continue
+                mg5.error ( f"no recaster left for {point}[{mg5.topo}] in job #{pid}" )
+                mg5.locker.unlock ( point )
+                mg5.record ( point, analyses, "failed" )
+                outcome = "failed"
+            results.put ( ( point, outcome ) )
+        ## our heartbeat renews the leases of the points that we handed
+        ## over, until a recaster adopts them, see Locker.handOver
+        while not handoff.empty() and not recastersGone.is_set():
+            time.sleep ( 1. )
+        print ( "%s[runPipeline] generator #%d finished%s" % \
+                ( ansi.GREEN, pid, ansi.RESET ) )
+
+    def recaster ( pid ):
+        while True:
+            point = handoff.get()
+            if point is None:
+                break
+            try:
+                outcome = mg5.recastPoint ( point, analyses, pid )
+            except Exception as e:
+                mg5.error ( f"recasting {point}[{mg5.topo}] failed in job #{pid}: {e}" )
+                mg5.locker.unlock ( point )
+                mg5.record ( point, analyses, "failed" )
+                outcome = "failed"
+            results.put ( ( point, outcome ) )
+        print ( "%s[runPipeline] recaster #%d finished%s" % \
+                ( ansi.GREEN, pid, ansi.RESET ) )
+
+    generators, recasters = [], []
+    for i in range(genWorkers):
+        p = multiprocessing.Process(target=generator, args=(i,))
+        generators.append ( p )
+        p.start()
+    for i in range(recastWorkers):
+        p = multiprocessing.Process(target=recaster, args=(genWorkers+i,))
+        recasters.append ( p )
+        p.start()
+    ## the recasters can stop once all generators are done
+    def stopRecasters():
+        import queue
+        for p in generators:
+            while p.is_alive():
+                p.join ( timeout = 10 )
+                if not any ( [ r.is_alive() for r in recasters ] ):
+                    recastersGone.set()
+        for p in recasters:
+            while any ( [ r.is_alive() for r in recasters ] ):
+                try: ## dont block forever, if the recasters died
+                    handoff.put ( None, timeout = 10 )
+                    break
+                except queue.Full:
+                    continue
+    stopper = threading.Thread ( target = stopRecasters )
+    stopper.start()
+    for point in list(masses) + [ None ] * genWorkers:
+        if not feedQueue ( todo, point, generators ):
+            mg5.error ( "all generators are gone, stop feeding them" )
+            break
+    ret = collectOutcomes ( mg5, results, generators + recasters, len(masses) )
+    stopper.join()
+    return ret
+
+def collectOutcomes ( mg5 : MG5Wrapper, results, jobs : List,
+                      npoints : int ) -> Dict:
+    """ collect the outcomes that the workers report back, then
+    wait for the workers to finish.
+
+    :param results: the queue that the workers report (point,outcome) to
+    :param jobs: the worker processes
+    :param npoints: the number of points that we expect to be reported
+    :returns: dictionary of outcome -> list of mass tuples
+    """
+    import queue
+    outcomes = { "done": [], "skipped": [], "locked": [], "failed": [] }
+    nreported = 0
+    while nreported < npoints:
+        try:
+            point, outcome = results.get ( timeout = 10 )
+        except queue.Empty:
+            if not any ( [ p.is_alive() for p in jobs ] ):
+                break
+            continue
+        nreported += 1
+        if not outcome in outcomes:
+            outcomes[outcome] = []
+        outcomes[outcome].append ( point )
+    for j in jobs:
+        j.join()
+    missing = npoints - nreported
+    if missing > 0:
+        ## a worker died without reporting back
+        mg5.error ( f"{missing} points were not reported back by the workers" )
+    summary = ", ".join ( [ f"{len(v)} {k}" for k,v in outcomes.items() ] )
+    mg5.announce ( f"{npoints} points for {mg5.topo}: {summary}" )
+    return outcomes
 
 def main():
     import argparse
@@ -732,6 +1365,24 @@ def main():
                              type=int, default=13 )
     argparser.add_argument ( '-p', '--nprocesses', help='number of process to run in parallel. 0 means 1 per CPU [1]',
                              type=int, default=1 )
+    argparser.add_argument ( '--prefetch', help='number of mass points queued per process ahead of time [2]',
+                             type=int, default=2 )
+    argparser.add_argument ( '--gen_workers', help='run generation and recasting as a pipeline, with this many MG5 workers. 0 means no pipeline [0]',
+                             type=int, default=0 )
+    argparser.add_argument ( '--recast_chunks', help='split the hepmc file of a point into this many chunks, and let ma5 recast them concurrently, efficiencies only. 0 means no splitting [0]',
+                             type=int, default=0 )
+    argparser.add_argument ( '--hepmc_fifo', help='stream the decompressed hepmc files into the standard input of delphes, instead of decompressing them to disk. checkmate and CBS still read decompressed files',
+                             action="store_true" )
+    argparser.add_argument ( '--hepmc_fanout', help='decompress the hepmc file of a point once, and feed it to the delphes runs of all cutlang analyses concurrently through pipes. checkmate and colliderbit run alongside',
+                             action="store_true" )
+    argparser.add_argument ( '--delphes_cache', help='size of the cache of the delphes outputs of cutlang in GB, shared by all analyses. 0 disables the cache [50]',
+                             type=float, default=50. )
+    argparser.add_argument ( '--cutlang_batch', help='run delphes once per point and delphes card, and cutlang for all analyses on its output',
+                             action="store_true" )
+    argparser.add_argument ( '--postfilter', help='apply the event condition to the delphes output, instead of to the hepmc events before delphes',
+                             action="store_true" )
+    argparser.add_argument ( '--recast_workers', help='number of recasting workers in the pipeline, 0 means as many as -p [0]',
+                             type=int, default=0 )
     argparser.add_argument ( '-T', '--topo', help='topology [T2]',
                              type=str, default="T2" )
     argparser.add_argument ( '-k', '--keep', help='keep temporary files',
@@ -780,8 +1431,20 @@ def main():
                              type=float, default=None )
     argparser.add_argument ( '-r', '--rerun', help='force rerun, even if there is a summary file already',
                              action="store_true" )
+    argparser.add_argument ( '--no_procdir_cache', help='do not reuse the process directories in mg5cache/, run "output" for every point',
+                             action="store_true" )
+    argparser.add_argument ( '--gridpack', help='integrate once per point and store the gridpack in mg5results/gridpacks/, then produce the events from the gridpack',
+                             action="store_true" )
+    argparser.add_argument ( '--ma5_effs_only', help='let ma5 compute only the efficiencies, skip the computation of the CLs limits',
+                             action="store_true" )
     argparser.add_argument ( '--dry_run', help='dry run, just print out the mass points',
                              action="store_true" )
+    argparser.add_argument ( '--plan', help='sort the points into new, partial and complete ones, write the plan file (see --plan_file), then quit',
+                             action="store_true" )
+    argparser.add_argument ( '--plan_file', help='the plan file to write with --plan, or to take the points from [<topo>_<njets>jet.plan with --plan, else None]',
+                             type=str, default=None )
+    argparser.add_argument ( '--resume', help='resume the campaign from the journal: run the points of topo/analyses/recaster that are not yet done, ignoring -m',
+                             action="store_true" )
     argparser.add_argument ( '--ignore_locks', help='ignore any locks. for debugging only.',
                              action="store_true" )
     #mdefault = "(2000,1000,10),(2000,1000,10)"
@@ -896,25 +1559,36 @@ def main():
         sys.exit()
 
     mg5 = MG5Wrapper( vars(args), recaster )
+    planfile = args.plan_file
+    if planfile == None:
+        planfile = f"{args.topo}_{args.njets}jet.plan"
+    if args.plan:
+        mg5.writePlan ( mg5.plan ( masses, args.analyses ), planfile, args.analyses )
+        sys.exit()
+    if args.plan_file != None:
+        masses = mg5.readPlan ( planfile )
+        nprocesses = bakeryHelpers.nJobs ( args.nprocesses, max(1,len(masses)) )
+        mg5.journal.enqueue ( args.topo, masses, args.sqrts, args.analyses, ",".join(recaster) )
+    elif args.resume:
+        ## take the points from the journal, not from the mass string
+        masses = mg5.journal.unfinished ( args.topo, args.sqrts, args.analyses,
+                                          ",".join(recaster) )
+        mg5.info ( f"resuming {len(masses)} unfinished points of {args.topo} from the journal" )
+        if len(masses) == 0:
+            sys.exit()
+        nprocesses = bakeryHelpers.nJobs ( args.nprocesses, len(masses) )
+    else:
+        mg5.journal.enqueue ( args.topo, masses, args.sqrts, args.analyses, ",".join(recaster) )
+    masses = mg5.filterDone ( masses, args.analyses )
     # mg5.info( "%d points to produce, in %d processes" % (nm,nprocesses) )
-    djobs = int(len(masses)/nprocesses)
-
-    def runChunk ( chunk, pid ):
-        for c in chunk:
-            mg5.run ( c, args.analyses, pid )
-        print ( "%s[runChunk] finished chunk #%d%s" % \
-                ( ansi.GREEN, pid, ansi.RESET ) )
-
-    jobs=[]
-    for i in range(nprocesses):
-        chunk = masses[djobs*i:djobs*(i+1)]
-        if i == nprocesses-1:
-            chunk = masses[djobs*i:]
-        p = multiprocessing.Process(target=runChunk, args=(chunk,i))
-        jobs.append ( p )
-        p.start()
-    for j in jobs:
-        j.join()
+    if args.gen_workers > 0 or args.recast_workers > 0:
+        genWorkers = args.gen_workers if args.gen_workers > 0 else nprocesses
+        recastWorkers = args.recast_workers if args.recast_workers > 0 else nprocesses
+        runPipeline ( mg5, masses, args.analyses, genWorkers, recastWorkers,
+                      args.prefetch )
+    else:
+        runQueue ( mg5, masses, args.analyses, nprocesses, args.prefetch )
+    mg5.exportEmbaked()
     if args.bake:
         import emCreator
         from types import SimpleNamespace
@@ -954,6 +1628,21 @@ def main_via_ini():
         "nevents"           : 10000,
         "njets"             : 1,
         "nprocesses"        : 1,
+        "prefetch"          : 2,
+        "gen_workers"       : 0,
+        "no_procdir_cache"  : False,
+        "gridpack"          : False,
+        "ma5_effs_only"     : False,
+        "resume"            : False,
+        "plan"              : False,
+        "plan_file"         : None,
+        "recast_workers"    : 0,
+        "recast_chunks"     : 0,
+        "hepmc_fifo"        : False,
+        "hepmc_fanout"      : False,
+        "delphes_cache"     : 50.,
+        "cutlang_batch"     : False,
+        "postfilter"        : False,
         "mingap1"           : None,
         "mingap2"           : None,
         "maxgap1"           : None,
@@ -1078,25 +1767,36 @@ def main_via_ini():
         sys.exit()
     recaster = [ "MA5" ]
     mg5 = MG5Wrapper( vars(ns), recaster )
+    planfile = ns.plan_file
+    if planfile == None:
+        planfile = f"{ns.topo}_{ns.njets}jet.plan"
+    if ns.plan:
+        mg5.writePlan ( mg5.plan ( masses, ns.analyses ), planfile, ns.analyses )
+        sys.exit()
+    if ns.plan_file != None:
+        masses = mg5.readPlan ( planfile )
+        nprocesses = bakeryHelpers.nJobs ( ns.nprocesses, max(1,len(masses)) )
+        mg5.journal.enqueue ( ns.topo, masses, ns.sqrts, ns.analyses, ",".join(recaster) )
+    elif ns.resume:
+        ## take the points from the journal, not from the mass string
+        masses = mg5.journal.unfinished ( ns.topo, ns.sqrts, ns.analyses,
+                                          ",".join(recaster) )
+        mg5.info ( f"resuming {len(masses)} unfinished points of {ns.topo} from the journal" )
+        if len(masses) == 0:
+            sys.exit()
+        nprocesses = bakeryHelpers.nJobs ( ns.nprocesses, len(masses) )
+    else:
+        mg5.journal.enqueue ( ns.topo, masses, ns.sqrts, ns.analyses, ",".join(recaster) )
+    masses = mg5.filterDone ( masses, ns.analyses )
     # mg5.info( "%d points to produce, in %d processes" % (nm,nprocesses) )
-    djobs = int(len(masses)/nprocesses)
-
-    def runChunk ( chunk, pid ):
-        for c in chunk:
-            mg5.run ( c, ns.analyses, pid )
-        print ( "%s[runChunk] finished chunk #%d%s" % \
-                ( ansi.GREEN, pid, ansi.RESET ) )
-
-    jobs=[]
-    for i in range(nprocesses):
-        chunk = masses[djobs*i:djobs*(i+1)]
-        if i == nprocesses-1:
-            chunk = masses[djobs*i:]
-        p = multiprocessing.Process(target=runChunk, args=(chunk,i))
-        jobs.append ( p )
-        p.start()
-    for j in jobs:
-        j.join()
+    if ns.gen_workers > 0 or ns.recast_workers > 0:
+        genWorkers = ns.gen_workers if ns.gen_workers > 0 else nprocesses
+        recastWorkers = ns.recast_workers if ns.recast_workers > 0 else nprocesses
+        runPipeline ( mg5, masses, ns.analyses, genWorkers, recastWorkers,
+                      ns.prefetch )
+    else:
+        runQueue ( mg5, masses, ns.analyses, nprocesses, ns.prefetch )
+    mg5.exportEmbaked()
     if ns.bake:
         import emCreator
         from types import SimpleNamespace
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+"""
+.. module:: weightsStore
+   :synopsis: an indexed store for the per signal region weights of ma5,
+              i.e. the number of events, the sum of weights, and the sum of
+              squared weights before and after the cuts. one row per
+              (analysis, topo, njets, masses, region), so reruns replace
+              older records. queries return numpy columns.
+"""
+
+import os, sys, time, sqlite3, ast, json, glob, colorama
+import numpy as np
+from typing import Dict, List, Union
+
+## the numerical columns, in the order of the table
+quantities = [ "nevents", "sumw", "sumw2", "total_nevents", "total_sumw",
+               "total_sumw2" ]
+
+def massesKey ( masses ) -> str:
+    """ the canonical key of a mass tuple, e.g. "(500, 200)" """
+    return str(tuple(masses))
+
+class WeightsStore:
+    def __init__ ( self, dirname : str = "weights" ):
+        """
+        :param dirname: the directory of the weights files. the database
+                        is dirname/weights.db
+        """
+        if dirname in [ None, "" ]:
+            dirname = "."
+        self.dirname = dirname
+        if not os.path.exists ( dirname ):
+            os.mkdir ( dirname )
+        self.dbfile = os.path.join ( dirname, "weights.db" )
+        self.create()
+
+    def error ( self, *msg ):
+        print ( "%s[weightsStore] %s%s" % ( colorama.Fore.RED, " ".join ( msg ), \
+                   colorama.Fore.RESET ) )
+
+    def connect ( self ):
+        return sqlite3.connect ( self.dbfile, timeout = 300 )
+
+    def create ( self ):
+        """ create the tables, if they do not exist """
+        conn = self.connect()
+        try:
+            with conn:
+                conn.execute ( """CREATE TABLE IF NOT EXISTS weights (
+                    analysis TEXT, topo TEXT, njets INTEGER, masses TEXT,
+                    region TEXT, nevents REAL, sumw REAL, sumw2 REAL,
+                    total_nevents REAL, total_sumw REAL, total_sumw2 REAL,
+                    created REAL,
+                    PRIMARY KEY ( analysis, topo, njets, masses, region ) )""" )
+                conn.execute ( "CREATE TABLE IF NOT EXISTS files ( file TEXT PRIMARY KEY, mtime REAL )" )
+        finally:
+            conn.close()
+
+    def put ( self, analysis : str, topo : str, njets : int, masses,
+              records : List[Dict] ):
+        """ add or replace the weights of one point, in one transaction.
+        :param analysis: analysis name, in SModelS naming
+        :param records: list of the weights per region, as returned by
+                        MA5Wrapper.extract
+        :raises: ValueError, if the initial counts differ across regions
+        """
+        totals = set ( [ ( r["__nevents__"], r["total_sum_weights"],
+                           r["total_sum_weights_squared"] ) for r in records ] )
+        if len(totals) > 1:
+            raise ValueError("Mismatch in the initial number of events or the initial sum of weights or squared weights across signal regions. Please check the MadAnalysis5 output.")
+        now = time.time()
+        rows = [ ( analysis, topo, njets, massesKey(masses), r["SR"],
+                   r["final_nevents"], r["final_sum_weights"],
+                   r["final_sum_weights_squared"], r["__nevents__"],
+                   r["total_sum_weights"], r["total_sum_weights_squared"], now ) \
+                 for r in records ]
+        conn = self.connect()
+        try:
+            with conn:
+                conn.executemany ( "INSERT OR REPLACE INTO weights VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows )
+        finally:
+            conn.close()
+
+    def importJson ( self, path : str ) -> int:
+        """ import a weights/<analysis>.<topo>.<njets>jet.MA5.json file of
+        json lines, as written by earlier versions. later lines win.
+        :returns: number of points imported
+        """
+        tokens = os.path.basename ( path ).split(".")
+        analysis, topo, njets = tokens[0], tokens[1], int(tokens[2].replace("jet",""))
+        points = {}
+        with open ( path, "rt" ) as f:
+            for line in f:
+                try:
+                    points.update ( json.loads ( line ) )
+                except json.JSONDecodeError as e:
+                    self.error ( f"skipping corrupt line in {path}: {e}" )
+        for smasses, regions in points.items():
+            common = regions["Common"]
+            records = [ { "SR": sr, "final_nevents": v["nevents"],
+                          "final_sum_weights": v["Sum_of_Weights"],
+                          "final_sum_weights_squared": v["Sum_of_Weights_Squared"],
+                          "__nevents__": common["__total_nevents__"],
+                          "total_sum_weights": common["__Total_Sum_of_Weights__"],
+                          "total_sum_weights_squared": common["__Total_Sum_of_Weights_Squared__"] } \
+                        for sr,v in regions.items() if sr != "Common" ]
+            self.put ( analysis, topo, njets, ast.literal_eval ( smasses ), records )
+        return len(points)
+
+    def compact ( self ) -> int:
+        """ import the json weights files that changed since the last
+        compaction, deduplicating reruns, then shrink the database.
+        :returns: number of points imported
+        """
+        conn = self.connect()
+        try:
+            known = dict ( conn.execute ( "SELECT file, mtime FROM files" ).fetchall() )
+        finally:
+            conn.close()
+        n = 0
+        for path in sorted ( glob.glob ( f"{self.dirname}/*.MA5.json" ) ):
+            mtime = os.stat ( path ).st_mtime
+            key = os.path.basename ( path )
+            if key in known and known[key] >= mtime:
+                continue
+            n += self.importJson ( path )
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.execute ( "INSERT OR REPLACE INTO files VALUES (?,?)", ( key, mtime ) )
+            finally:
+                conn.close()
+        conn = self.connect()
+        try:
+            conn.execute ( "VACUUM" )
+        finally:
+            conn.close()
+        return n
+
+    def columns ( self, analysis : str, topo : str, njets : int,
+                  masses : Union[None,List] = None,
+                  region : Union[None,str] = None ) -> Dict:
+        """ the weights as columns, optionally only of some points or
+        of one region.
+        :param masses: list of mass tuples, None for all points
+        :returns: dictionary with "masses" and "region" as lists, and the
+                  quantities as numpy arrays
+        """
+        query = "SELECT masses, region, " + ", ".join ( quantities ) + \
+                " FROM weights WHERE analysis=? AND topo=? AND njets=?"
+        params = [ analysis, topo, njets ]
+        if region != None:
+            query += " AND region=?"
+            params.append ( region )
+        conn = self.connect()
+        try:
+            rows = conn.execute ( query + " ORDER BY masses, region", params ).fetchall()
+        finally:
+            conn.close()
+        if masses != None:
+            keys = set ( [ massesKey(m) for m in masses ] )
+            rows = [ r for r in rows if r[0] in keys ]
+        ret = { "masses": [ ast.literal_eval ( r[0] ) for r in rows ],
+                "region": [ r[1] for r in rows ] }
+        values = np.array ( [ r[2:] for r in rows ], dtype=float ).reshape ( len(rows), len(quantities) )
+        for i,q in enumerate ( quantities ):
+            ret[q] = values[:,i]
+        return ret
+
+    def efficiencies ( self, analysis : str, topo : str, njets : int,
+                       masses : Union[None,List] = None,
+                       region : Union[None,str] = None ) -> Dict:
+        """ the columns, plus the efficiencies and their statistical
+        uncertainties, see efficiencies() """
+        return efficiencies ( self.columns ( analysis, topo, njets, masses, region ) )
+
+    def count ( self ) -> Dict:
+        """ the number of points per (analysis, topo, njets) """
+        conn = self.connect()
+        try:
+            rows = conn.execute ( "SELECT analysis, topo, njets, COUNT(DISTINCT masses) FROM weights GROUP BY analysis, topo, njets" ).fetchall()
+        finally:
+            conn.close()
+        return { r[:3]: r[3] for r in rows }
+
+def efficiencies ( columns : Dict ) -> Dict:
+    """ add the efficiencies, sumw/total_sumw, and their statistical
+    uncertainties, sqrt(sumw2)/total_sumw, to columns """
+    total = np.where ( columns["total_sumw"] != 0., columns["total_sumw"], np.nan )
+    columns["eff"] = columns["sumw"] / total
+    columns["statunc"] = np.sqrt ( columns["sumw2"] ) / total
+    return columns
+
+def merge ( *columns ) -> Dict:
+    """ merge the columns of independent runs of the same points, e.g. to
+    add statistics: all counts of the same point and region are summed.
+    :returns: the merged columns
+    """
+    index, keys = [], {}
+    for c in columns:
+        for m,r in zip ( c["masses"], c["region"] ):
+            index.append ( keys.setdefault ( ( tuple(m), r ), len(keys) ) )
+    ret = { "masses": [ k[0] for k in keys ], "region": [ k[1] for k in keys ] }
+    for q in quantities:
+        values = np.concatenate ( [ c[q] for c in columns ] )
+        ret[q] = np.bincount ( index, weights = values, minlength = len(keys) )
+    return ret
+
+if __name__ == "__main__":
+    import argparse
+    argparser = argparse.ArgumentParser(description='the store of the ma5 weights.')
+    argparser.add_argument ( '-d', '--dirname', help='directory of the weights files [weights]',
+                             type=str, default="weights" )
+    argparser.add_argument ( '-c', '--compact', help='import the json weights files, deduplicating reruns',
+                             action="store_true" )
+    argparser.add_argument ( '-l', '--list', help='list the number of points per analysis and topology',
+                             action="store_true" )
+    args = argparser.parse_args()
+    store = WeightsStore ( args.dirname )
+    if args.compact:
+        n = store.compact()
+        print ( f"[weightsStore] imported {n} points" )
+    if args.list:
+        for ( analysis, topo, njets ), n in store.count().items():
+            print ( f"{analysis} {topo} {njets}jet: {n} points" )